@@ -0,0 +1,85 @@
+"""
+Compares two results of the fawoc benchmarks
+
+For each size and benchmark, the median time of the new result is compared
+with the one of the old result. The benchmarks slower than the threshold are
+marked as regressions.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(old, new, threshold):
+    """
+    Compares the median times of two results
+
+    :param old: the old result
+    :type old: dict
+    :param new: the new result
+    :type new: dict
+    :param threshold: ratio new/old over which a benchmark is a regression
+    :type threshold: float
+    :return: the report lines and the number of regressions
+    :rtype: (list[str], int)
+    """
+    lines = []
+    regressions = 0
+    for size, benches in new['results'].items():
+        old_benches = old['results'].get(size)
+        if old_benches is None:
+            continue
+
+        for name, res in benches.items():
+            old_res = old_benches.get(name)
+            if old_res is None or old_res['n'] == 0 or res['n'] == 0:
+                continue
+
+            ratio = res['median'] / old_res['median']
+            mark = ''
+            if ratio > threshold:
+                mark = ' REGRESSION'
+                regressions += 1
+
+            lines.append(f'{size:>10} {name:30} {old_res["median"]:12.6f} '
+                         f'{res["median"]:12.6f} {ratio:7.2f}x{mark}')
+
+    return lines, regressions
+
+
+def init_argparser():
+    """
+    Initialize the command line parser.
+
+    :return: the command line parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('old', help='JSON file of the old result')
+    parser.add_argument('new', help='JSON file of the new result')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='ratio new/old over which a benchmark is a '
+                             'regression (default: 1.2)')
+    return parser
+
+
+def main():
+    args = init_argparser().parse_args()
+    with open(args.old) as file:
+        old = json.load(file)
+
+    with open(args.new) as file:
+        new = json.load(file)
+
+    print(f'old: {old["meta"]["commit"]}')
+    print(f'new: {new["meta"]["commit"]}')
+    lines, regressions = compare(old, new, args.threshold)
+    print(f'{"size":>10} {"benchmark":30} {"old median":>12} '
+          f'{"new median":>12} {"ratio":>8}')
+    print('\n'.join(lines))
+    if regressions > 0:
+        sys.exit(f'{regressions} regressions')
+
+
+if __name__ == '__main__':
+    main()
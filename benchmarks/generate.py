@@ -0,0 +1,211 @@
+"""
+Deterministic generator of synthetic vocabularies for the fawoc benchmarks
+
+The generated vocabulary is a list of unique n-grams (from 1 to MAX_NGRAM
+tokens) with a realistic overlap: the tokens follow a Zipf distribution and
+most of the longer n-grams extend a shorter one, so the related terms searched
+by fawoc are found. A fraction of the terms is classified.
+The generator writes the same files written by fawoc:
+
+* the tsv file with the terms and their labels;
+* the *_fawoc_data.tsv file with the count of each term;
+* the *_fawoc_data.json file with the order and related term of the
+  classified terms.
+
+The same size and seed always give the same files.
+"""
+import argparse
+import bisect
+import csv
+import itertools
+import json
+import pathlib
+import random
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'fawoc'))
+
+from terms import Label
+
+# weights of the number of tokens of the generated n-grams
+NGRAM_WEIGHTS = [2, 4, 3, 1]
+MAX_NGRAM = len(NGRAM_WEIGHTS)
+# probability that an n-gram extends a shorter one
+EXTEND_PROB = 0.7
+# exponent of the Zipf distribution of the tokens
+ZIPF_EXP = 1.1
+SYLLABLES = ['ba', 'ce', 'di', 'fo', 'gu', 'ha', 'ke', 'li', 'mo', 'nu',
+             'pa', 're', 'si', 'to', 'vu', 'za', 'ter', 'mon', 'lis', 'dra']
+
+
+def parse_size(size):
+    """
+    Parses a number of terms with an optional k or M suffix
+
+    :param size: the number of terms (e.g. '10k' or '2M')
+    :type size: str
+    :return: the number of terms
+    :rtype: int
+    :raise argparse.ArgumentTypeError: if size is not a valid size
+    """
+    mult = {'k': 1000, 'K': 1000, 'm': 1000 * 1000, 'M': 1000 * 1000}
+    try:
+        if size[-1] in mult:
+            n = int(float(size[:-1]) * mult[size[-1]])
+        else:
+            n = int(size)
+    except (IndexError, ValueError):
+        raise argparse.ArgumentTypeError(f'invalid size {size!r}')
+
+    if n <= 0:
+        raise argparse.ArgumentTypeError(f'invalid size {size!r}')
+
+    return n
+
+
+def make_tokens(n):
+    """
+    Creates n distinct word-like tokens
+
+    :param n: number of tokens
+    :type n: int
+    :return: the tokens, shortest first
+    :rtype: list[str]
+    """
+    tokens = []
+    length = 1
+    while len(tokens) < n:
+        for syl in itertools.product(SYLLABLES, repeat=length):
+            tokens.append(''.join(syl))
+            if len(tokens) == n:
+                break
+
+        length += 1
+
+    return tokens
+
+
+class _Zipf:
+    """
+    Draws indexes in range(n) with a Zipf distribution
+    """
+
+    def __init__(self, n, rnd, exp=ZIPF_EXP):
+        self._cum = list(itertools.accumulate(1 / (r + 1) ** exp
+                                              for r in range(n)))
+        self._rnd = rnd
+
+    def __call__(self):
+        x = self._rnd.random() * self._cum[-1]
+        return min(bisect.bisect(self._cum, x), len(self._cum) - 1)
+
+
+def generate_terms(n_terms, seed=0):
+    """
+    Generates a vocabulary of unique n-grams
+
+    :param n_terms: number of n-grams to generate
+    :type n_terms: int
+    :param seed: seed of the generator
+    :type seed: int
+    :return: the n-grams, as an iterator
+    :rtype: Generator[str, Any, None]
+    """
+    rnd = random.Random(seed)
+    tokens = make_tokens(max(100, int(n_terms ** 0.75)))
+    token = _Zipf(len(tokens), rnd)
+    seen = set()
+    by_len = [[] for _ in range(MAX_NGRAM + 1)]
+    lengths = list(range(1, MAX_NGRAM + 1))
+    while len(seen) < n_terms:
+        n = rnd.choices(lengths, NGRAM_WEIGHTS)[0]
+        shorter = by_len[n - 1]
+        if n > 1 and len(shorter) > 0 and rnd.random() < EXTEND_PROB:
+            # the most used n-grams are the first ones generated
+            base = shorter[int(len(shorter) * rnd.random() ** 3)]
+            if rnd.random() < 0.5:
+                term = ' '.join([base, tokens[token()]])
+            else:
+                term = ' '.join([tokens[token()], base])
+        else:
+            term = ' '.join(tokens[token()] for _ in range(n))
+
+        if term in seen:
+            continue
+
+        seen.add(term)
+        by_len[n].append(term)
+        yield term
+
+
+def generate(tsvfile, n_terms, seed=0, classified=0.2):
+    """
+    Writes a synthetic vocabulary and its service files
+
+    :param tsvfile: path of the tsv file to write
+    :type tsvfile: str or pathlib.Path
+    :param n_terms: number of terms to generate
+    :type n_terms: int
+    :param seed: seed of the generator
+    :type seed: int
+    :param classified: fraction of the terms that are classified
+    :type classified: float
+    """
+    path = pathlib.Path(tsvfile)
+    stem = path.parent / path.stem
+    rnd = random.Random(seed + 1)
+    labels = [Label.labels[lab] for lab in Label.labels
+              if Label.labels[lab] != Label.labels['NONE']]
+    service_data = {}
+    order = 0
+    with open(path, 'w', newline='', encoding='utf-8') as terms_file, \
+            open(f'{stem}_fawoc_data.tsv', 'w', newline='',
+                 encoding='utf-8') as data_file:
+        terms_writer = csv.writer(terms_file, delimiter='\t')
+        terms_writer.writerow(['id', 'term', 'label'])
+        data_writer = csv.writer(data_file, delimiter='\t')
+        data_writer.writerow(['id', 'term', 'count'])
+        for index, term in enumerate(generate_terms(n_terms, seed)):
+            label = ''
+            if rnd.random() < classified:
+                label = rnd.choice(labels)[0]
+                related = ''
+                if rnd.random() < 0.5:
+                    related = rnd.choice(term.split())
+
+                service_data[index] = {'order': order, 'related': related}
+                order += 1
+
+            terms_writer.writerow([index, term, label])
+            count = int(rnd.paretovariate(1.2))
+            data_writer.writerow([index, term, count])
+
+    with open(f'{stem}_fawoc_data.json', 'w', encoding='utf-8') as json_file:
+        json.dump(service_data, json_file)
+
+
+def init_argparser():
+    """
+    Initialize the command line parser.
+
+    :return: the command line parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('tsvfile', help='path of the tsv file to write')
+    parser.add_argument('size', type=parse_size,
+                        help='number of terms, with an optional k or M suffix')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the generator (default: 0)')
+    parser.add_argument('--classified', type=float, default=0.2,
+                        help='fraction of classified terms (default: 0.2)')
+    return parser
+
+
+def main():
+    args = init_argparser().parse_args()
+    generate(args.tsvfile, args.size, args.seed, args.classified)
+
+
+if __name__ == '__main__':
+    main()
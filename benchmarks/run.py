@@ -0,0 +1,386 @@
+"""
+Benchmarks of the hot paths of fawoc
+
+For each size, a synthetic vocabulary is generated with generate.py and these
+operations are timed:
+
+* TermList.from_tsv and TermList.load_service_data;
+* TermList.return_related_items with terms and single tokens as keys;
+* graph.build_graph, and TermList.return_related_items with terms as keys
+  when the containment graph is set;
+* Fawoc.do_classify, Fawoc.do_autonoise and Fawoc.undo, run without a terminal
+  against a Gui that shows nothing, so only the logic of fawoc is timed;
+* TermList.to_tsv and TermList.save_service_data.
+
+The results are written as JSON. Two results can be compared with compare.py.
+"""
+import argparse
+import json
+import logging
+import pathlib
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'fawoc'))
+
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import DummyInput
+from prompt_toolkit.layout import Window
+from prompt_toolkit.output import DummyOutput
+
+import generate
+from fawoc import Fawoc
+from graph import build_graph
+from terms import Label, TermList
+from version import __version__
+
+# number of keys searched by the return_related_items benchmark
+RELATED_KEYS = 100
+
+
+class DummyGui:
+    """
+    A Gui that shows nothing, to run Fawoc without a terminal
+    """
+
+    def __init__(self):
+        self._body = Window()
+
+    @property
+    def body(self):
+        return self._body
+
+    @property
+    def help_shown(self):
+        return False
+
+    def show_help(self):
+        pass
+
+    def hide_help(self):
+        pass
+
+    def refresh_label_windows(self, term_to_highlight, label):
+        pass
+
+    def set_stats(self, stats):
+        pass
+
+    def set_terms(self, to_classify, sort_key):
+        pass
+
+    def update_windows(self, to_classify, classified, postponed,
+                       term_to_highlight, sort_word_key, stats_str):
+        pass
+
+    def assign_labeled_terms(self, classified, postponed):
+        pass
+
+
+def summary(times):
+    """
+    Summarizes a list of timings
+
+    :param times: the timings in seconds
+    :type times: list[float]
+    :return: the number of timings, their total, mean, median, min and max
+    :rtype: dict[str, float]
+    """
+    if len(times) == 0:
+        return {'n': 0}
+
+    return {
+        'n': len(times),
+        'total': sum(times),
+        'mean': statistics.mean(times),
+        'median': statistics.median(times),
+        'min': min(times),
+        'max': max(times),
+    }
+
+
+def timed(func, *args, **kwargs):
+    """
+    Calls a function and times it
+
+    :param func: the function to call
+    :type func: Callable
+    :return: the time elapsed in seconds and the value returned by func
+    :rtype: (float, Any)
+    """
+    start = time.perf_counter()
+    ret = func(*args, **kwargs)
+    return time.perf_counter() - start, ret
+
+
+def load(tsvfile):
+    """
+    Loads the terms as fawoc does
+
+    :param tsvfile: path of the tsv file
+    :type tsvfile: pathlib.Path
+    :return: the terms
+    :rtype: TermList
+    """
+    terms = TermList()
+    terms.from_tsv(tsvfile)
+    terms.load_service_data(tsvfile)
+    terms.sort_by_order()
+    return terms
+
+
+def bench_load(tsvfile, repeat):
+    """
+    Times from_tsv and load_service_data
+
+    :param tsvfile: path of the tsv file
+    :type tsvfile: pathlib.Path
+    :param repeat: number of repetitions
+    :type repeat: int
+    :return: the results of from_tsv and load_service_data
+    :rtype: dict[str, dict]
+    """
+    from_tsv = []
+    service = []
+    for _ in range(repeat):
+        terms = TermList()
+        t, _ = timed(terms.from_tsv, tsvfile)
+        from_tsv.append(t)
+        t, _ = timed(terms.load_service_data, tsvfile)
+        service.append(t)
+
+    return {'from_tsv': summary(from_tsv),
+            'load_service_data': summary(service)}
+
+
+def bench_related(terms, rnd):
+    """
+    Times return_related_items with terms and tokens as keys
+
+    :param terms: the terms
+    :type terms: TermList
+    :param rnd: random generator used to choose the keys
+    :type rnd: random.Random
+    :return: the results of return_related_items
+    :rtype: dict[str, dict]
+    """
+    strings = rnd.sample(terms.get_strings(), min(RELATED_KEYS, len(terms)))
+    times = []
+    for key in strings:
+        t, _ = timed(terms.return_related_items, key)
+        times.append(t)
+
+    tokens = [rnd.choice(s.split()) for s in strings]
+    token_times = []
+    for key in tokens:
+        t, _ = timed(terms.return_related_items, key)
+        token_times.append(t)
+
+    return {'return_related_items': summary(times),
+            'return_related_items_token': summary(token_times)}
+
+
+def bench_graph(terms, rnd):
+    """
+    Times build_graph and return_related_items with the graph
+
+    The graph is removed from terms at the end.
+
+    :param terms: the terms
+    :type terms: TermList
+    :param rnd: random generator used to choose the keys
+    :type rnd: random.Random
+    :return: the results of build_graph and return_related_items
+    :rtype: dict[str, dict]
+    """
+    t, graph = timed(build_graph, terms)
+    terms.set_graph(graph)
+    strings = rnd.sample(terms.get_strings(), min(RELATED_KEYS, len(terms)))
+    times = []
+    for key in strings:
+        t_key, _ = timed(terms.return_related_items, key)
+        times.append(t_key)
+
+    terms.set_graph(None)
+    return {'build_graph': summary([t]),
+            'return_related_items_graph': summary(times)}
+
+
+def bench_fawoc(tsvfile, actions, rnd):
+    """
+    Times the classification keys of Fawoc
+
+    Some terms are classified, some autonoise runs are done, and then all the
+    classifications are undone. Nothing is saved.
+
+    :param tsvfile: path of the tsv file
+    :type tsvfile: pathlib.Path
+    :param actions: number of classifications
+    :type actions: int
+    :param rnd: random generator used to choose the labels
+    :type rnd: random.Random
+    :return: the results of do_classify, do_autonoise and undo
+    :rtype: dict[str, dict]
+    """
+    args = argparse.Namespace(datafile=str(tsvfile), dry_run=True,
+                              no_auto_save=True, no_info_file=False)
+    logger = logging.getLogger('fawoc_benchmarks')
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    review = Label.labels['NONE']
+    keys = Label.get_classifying_keybindings()
+    with create_app_session(input=DummyInput(), output=DummyOutput()):
+        fawoc = Fawoc(args, load(tsvfile), review, DummyGui(), logger, logger)
+        classify = []
+        for _ in range(actions):
+            label = Label.get_from_keybinding(rnd.choice(keys))
+            t, _ = timed(fawoc.do_classify, label)
+            classify.append(t)
+
+        autonoise = []
+        for _ in range(max(1, actions // 20)):
+            t, _ = timed(fawoc.do_autonoise)
+            autonoise.append(t)
+
+        undo = []
+        for _ in range(actions + len(autonoise)):
+            t, _ = timed(fawoc.undo)
+            undo.append(t)
+
+        fawoc.close()
+
+    return {'do_classify': summary(classify),
+            'do_autonoise': summary(autonoise),
+            'undo': summary(undo)}
+
+
+def bench_save(terms, workdir, repeat):
+    """
+    Times to_tsv and save_service_data
+
+    :param terms: the terms
+    :type terms: TermList
+    :param workdir: the directory where the files are written
+    :type workdir: pathlib.Path
+    :param repeat: number of repetitions
+    :type repeat: int
+    :return: the results of to_tsv and save_service_data
+    :rtype: dict[str, dict]
+    """
+    outfile = workdir / 'saved.tsv'
+    to_tsv = []
+    service = []
+    for _ in range(repeat):
+        t, _ = timed(terms.to_tsv, outfile)
+        to_tsv.append(t)
+        t, _ = timed(terms.save_service_data, outfile)
+        service.append(t)
+
+    return {'to_tsv': summary(to_tsv),
+            'save_service_data': summary(service)}
+
+
+def run_size(n_terms, args):
+    """
+    Runs all the benchmarks on a vocabulary
+
+    :param n_terms: number of terms of the vocabulary
+    :type n_terms: int
+    :param args: command line arguments
+    :type args: argparse.Namespace
+    :return: the results of each benchmark
+    :rtype: dict[str, dict]
+    """
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix='fawoc_bench_'))
+    try:
+        tsvfile = workdir / f'terms_{n_terms}.tsv'
+        t, _ = timed(generate.generate, tsvfile, n_terms, args.seed)
+        print(f'{n_terms} terms generated in {t:.2f}s', file=sys.stderr)
+        rnd = random.Random(args.seed)
+        results = bench_load(tsvfile, args.repeat)
+        terms = load(tsvfile)
+        results.update(bench_related(terms, rnd))
+        results.update(bench_graph(terms, rnd))
+        results.update(bench_fawoc(tsvfile, args.actions, rnd))
+        results.update(bench_save(terms, workdir, args.repeat))
+    finally:
+        shutil.rmtree(workdir)
+
+    return results
+
+
+def git_commit():
+    """
+    Gives the commit of the working tree, if any
+
+    :return: the hash of the commit or None
+    :rtype: str or None
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                             cwd=pathlib.Path(__file__).resolve().parent,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return out.stdout.strip()
+
+
+def init_argparser():
+    """
+    Initialize the command line parser.
+
+    :return: the command line parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', nargs='+', type=generate.parse_size,
+                        default=[10000, 100000],
+                        help='number of terms of each vocabulary, with an '
+                             'optional k or M suffix (default: 10k 100k)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the generator (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repetitions of the load and save benchmarks '
+                             '(default: 3)')
+    parser.add_argument('--actions', type=int, default=200,
+                        help='number of classifications (default: 200)')
+    parser.add_argument('--output', '-o',
+                        help='JSON file of the results (default: stdout)')
+    return parser
+
+
+def main():
+    args = init_argparser().parse_args()
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'actions': args.actions,
+        },
+        'results': {},
+    }
+    for n in args.sizes:
+        results['results'][str(n)] = run_size(n, args)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,11 @@
 import argparse
+import asyncio
+import concurrent.futures
 import json
 import logging
 import os
 import pathlib
 import sys
-import time
 from typing import cast, Hashable
 
 from prompt_toolkit import Application
@@ -21,17 +22,32 @@ from prompt_toolkit.lexers import Lexer
 from prompt_toolkit.widgets import TextArea, Frame, Dialog, Label as PT_Label
 
 from slrkit_utils.argument_parser import ArgParse
-from terms import InvalidServiceDataError, Label, TermList, Term
-from utils import setup_logger, substring_index
+from graph import InvalidGraphError, build_graph, graph_file, load_graph
+from merge import MergeError, merge
+from rules import InvalidRulesError, apply_rules, load_rules
+from sqlite_terms import SqliteTermList
+from terms import (InvalidServiceDataError, InvalidTsvError, Label, TermList,
+                   TermQueue, Term, SaveWorker)
+from timings import Timings
+from utils import setup_logger, word_matcher
 from version import __version__
 
 
 DEBUG = False
 # number of classification before an actual save
 SAVE_COUNT_THRESHOLD = 10
+# number of rows shown while the datafile is loaded
+PREVIEW_ROWS = 1000
+# maximum number of lines kept by the cache of each TermLexer
+LEXER_CACHE_SIZE = 1000
 
 
 class TermLexer(Lexer):
+    # role of a line in the document: it changes how the line is highlighted
+    _PLAIN = 0
+    _HEADER = 1
+    _FIRST = 2
+
     def invalidation_hash(self) -> Hashable:
         return self._inv
 
@@ -42,6 +58,8 @@ class TermLexer(Lexer):
         self._whole_line = False
         self._show_header = False
         self._highlight_first = False
+        # formatted lines by (line, role), valid for the current settings
+        self._cache = {}
 
     @property
     def highlight_first(self) -> bool:
@@ -49,8 +67,9 @@ class TermLexer(Lexer):
 
     @highlight_first.setter
     def highlight_first(self, highlight_first: bool):
-        self._highlight_first = highlight_first
-        self._handle_inv()
+        if highlight_first != self._highlight_first:
+            self._highlight_first = highlight_first
+            self._handle_inv()
 
     @property
     def show_header(self) -> bool:
@@ -58,8 +77,9 @@ class TermLexer(Lexer):
 
     @show_header.setter
     def show_header(self, show_header: bool):
-        self._show_header = show_header
-        self._handle_inv()
+        if show_header != self._show_header:
+            self._show_header = show_header
+            self._handle_inv()
 
     @property
     def word(self) -> str:
@@ -67,11 +87,12 @@ class TermLexer(Lexer):
 
     @word.setter
     def word(self, word: str):
-        self._word = word
         if len(word) == 1:
-            self._word += ' '
+            word += ' '
 
-        self._handle_inv()
+        if word != self._word:
+            self._word = word
+            self._handle_inv()
 
     @property
     def color(self) -> str:
@@ -79,10 +100,15 @@ class TermLexer(Lexer):
 
     @color.setter
     def color(self, color: str):
-        self._color = color
-        self._handle_inv()
+        if color != self._color:
+            self._color = color
+            self._handle_inv()
 
     def _handle_inv(self):
+        """
+        Invalidates the output of the lexer after a change of the settings
+        """
+        self._cache.clear()
         self._inv += 1
         # avoid overflow problems
         if self._inv > 10 * 1000 * 1000:
@@ -102,46 +128,81 @@ class TermLexer(Lexer):
 
     @whole_line.setter
     def whole_line(self, whole: bool):
-        self._whole_line = whole
-        self._inv += 1
+        if whole != self._whole_line:
+            self._whole_line = whole
+            self._handle_inv()
 
-    def lex_document(self, document):
-        lines = []
-        for i, line in enumerate(document.lines):
-            fmt = []
-            if i == 0 and self.show_header:
-                lines.append([('underline', line)])
-                continue
+    def _lex_line(self, line, role):
+        """
+        Formats a line
+
+        :param line: the line to format
+        :type line: str
+        :param role: role of the line in the document
+        :type role: int
+        :return: the formatted line
+        :rtype: list[tuple[str, str]]
+        """
+        if role == self._HEADER:
+            return [('underline', line)]
+
+        fmt = []
+        fmt_first = ''
+        if role == self._FIRST:
+            fmt_first = 'bold'
+
+        prev = 0
+        if self.whole_line:
+            if line == self.word:
+                fmt.append((f'#{self.color} bold', line))
+            else:
+                fmt.append(('', line))
+        else:
+            if len(self.word) == 2 and self.word[-1] == ' ':
+                word = self.word[0]
+            else:
+                word = self.word
+            for begin, end in word_matcher(word).finditer(line):
+                if begin > prev:
+                    fmt.append((f'{fmt_first}', line[prev:begin]))
 
-            fmt_first = ''
-            if i == 1 and self._highlight_first:
-                fmt_first = 'bold'
+                fmt.append((f'#{self.color} bold {fmt_first}',
+                            line[begin:end]))
+                prev = end
 
-            prev = 0
-            if self.whole_line:
-                if line == self.word:
-                    fmt.append((f'#{self.color} bold', line))
-                else:
-                    fmt.append(('', line))
+            if prev < len(line) - 1:
+                fmt.append((f'{fmt_first}', line[prev:]))
+
+        return fmt
+
+    def lex_document(self, document):
+        lines = document.lines
+
+        def get_line(lineno):
+            # the lines are formatted only when they are requested
+            try:
+                line = lines[lineno]
+            except IndexError:
+                return []
+
+            if lineno == 0 and self._show_header:
+                role = self._HEADER
+            elif lineno == 1 and self._highlight_first:
+                role = self._FIRST
             else:
-                if len(self.word) == 2 and self.word[-1] == ' ':
-                    word = self.word[0]
-                else:
-                    word = self.word
-                for begin, end in substring_index(line, word):
-                    if begin > prev:
-                        fmt.append((f'{fmt_first}', line[prev:begin]))
+                role = self._PLAIN
 
-                    fmt.append((f'#{self.color} bold {fmt_first}',
-                                line[begin:end]))
-                    prev = end
+            fmt = self._cache.get((line, role))
+            if fmt is None:
+                fmt = self._lex_line(line, role)
+                if len(self._cache) >= LEXER_CACHE_SIZE:
+                    self._cache.clear()
 
-                if prev < len(line) - 1:
-                    fmt.append((f'{fmt_first}', line[prev:]))
+                self._cache[(line, role)] = fmt
 
-            lines.append(fmt)
+            return fmt
 
-        return lambda lineno: lines[lineno]
+        return get_line
 
 
 class Win:
@@ -157,7 +218,7 @@ class Win:
     :type buffer: Buffer
     :type control: BufferControl
     :type window: Window
-    :type terms: list[Term] or None
+    :type terms: list[Term] or TermView or TermQueue or None
     :type attr: FormattedTextControl or None
     """
 
@@ -259,15 +320,18 @@ class Win:
         """
         Assigns the terms to the window
 
+        The window shows a view of terms, so it shows also the changes made
+        to terms after this call.
+
         :param terms: terms to assign
         :type terms: TermList
         :param classified: if True, only the classified terms are assigned
         :type classified: bool
         """
         if classified:
-            self.terms = terms.get_classified().items
+            self.terms = terms.view().filter(Term.is_classified)
         else:
-            self.terms = terms.get_not_classified().items
+            self.terms = terms.view().filter(lambda t: not t.is_classified())
 
     def assign_lines(self, terms):
         """
@@ -420,7 +484,9 @@ class Gui:
             l = Label.labels[label]
             help_text.append(('', ' '.join([l[1], l[0], '\n'])))
 
-        help_text.extend([('', 'w save immediately\n'),
+        help_text.extend([('', 'y redo the last undo\n'),
+                          ('', 'w save immediately\n'),
+                          ('', 't show/hide the timings\n'),
                           ('', 'q quit\n'), ('', '\n'),
                           ('red', 'Press any key to close')])
         help_width = max([len(h[1]) for h in help_text])
@@ -443,6 +509,7 @@ class Gui:
             ]
         ), floats=[])
         self._help_shown = False
+        self._timings = None
 
     def show_help(self):
         self._body.floats.append(self._help)
@@ -452,6 +519,26 @@ class Gui:
         self._body.floats.remove(self._help)
         self._help_shown = False
 
+    def toggle_timings(self, timings):
+        """
+        Shows or hides the timings of the actions
+
+        The shown timings are updated at each refresh of the screen.
+
+        :param timings: the timings to show
+        :type timings: Timings
+        """
+        if self._timings is not None:
+            self._body.floats.remove(self._timings)
+            self._timings = None
+            return
+
+        timings_label = PT_Label(text=lambda: '\n'.join(timings.format()),
+                                 dont_extend_height=True)
+        frame = Frame(body=timings_label, title='Timings (ms)')
+        self._timings = Float(content=frame, top=0, right=0)
+        self._body.floats.append(self._timings)
+
     @property
     def body(self):
         return self._body
@@ -530,12 +617,12 @@ class Gui:
         """
         Sets the terms to be classified in the proper window
 
-        :param to_classify: list of terms to be classified
-        :type to_classify: TermList
+        :param to_classify: queue of terms to be classified
+        :type to_classify: TermQueue
         :param sort_key: string used for searching the related terms
         :type sort_key: str
         """
-        self._word_win.terms = to_classify.items
+        self._word_win.terms = to_classify
         self._word_win.display_lines(rev=False, highlight_word=sort_key)
 
     def update_windows(self, to_classify, classified, postponed,
@@ -544,7 +631,7 @@ class Gui:
         Handle the update of all the windows
 
         :param to_classify: terms not yet classified
-        :type to_classify: TermList
+        :type to_classify: TermQueue
         :param classified: list of classified terms
         :type classified: TermList
         :param postponed: list of postponed terms
@@ -558,9 +645,9 @@ class Gui:
         """
         self.set_terms(to_classify, sort_word_key)
 
-        self._post_win.terms = postponed.items
+        self._post_win.terms = postponed.view()
 
-        self._class_win.terms = classified.items
+        self._class_win.terms = classified.view()
 
         if term_to_highlight is not None:
             self.refresh_label_windows(term_to_highlight.string,
@@ -583,15 +670,116 @@ class Gui:
         self._post_win.assign_terms(postponed, classified=True)
 
 
+class Operation:
+    """
+    A classification recorded in the operation log of Fawoc
+
+    An Operation records the previous label, order and related term of the
+    classified term, and the previous state of the queue of the terms to
+    classify, so the classification can be undone restoring exactly the
+    previous state.
+    The Operations rebuilt from the service data (see from_term) know only
+    the classified term: undoing them, the related terms are searched again.
+    A bulk action (like autonoise) is recorded as a single Operation, whose
+    group holds all the classified terms, with the consecutive orders in
+    orders. The previous label, order and related term are the ones of the
+    first term: all the terms of a group come from the queue, so they are
+    the same for all of them.
+
+    :type term: Term
+    :type label: Label
+    :type prev_label: Label
+    :type prev_order: int
+    :type prev_related: str
+    :type sort_key: str
+    :type related_count: int or None
+    :type last_order: int or None
+    :type from_front: bool
+    :type front: list[Term] or None
+    :type group: list[Term] or None
+    :type orders: range or None
+    """
+    __slots__ = ('term', 'label', 'prev_label', 'prev_order', 'prev_related',
+                 'sort_key', 'related_count', 'last_order', 'from_front',
+                 'front', 'group', 'orders')
+
+    def __init__(self, term, label, prev_label, prev_order, prev_related,
+                 sort_key, related_count, last_order, from_front, front=None,
+                 group=None, orders=None):
+        """
+        :param term: the classified term
+        :type term: Term
+        :param label: the label assigned to the term
+        :type label: Label
+        :param prev_label: the label of the term before the classification
+        :type prev_label: Label
+        :param prev_order: the order of the term before the classification
+        :type prev_order: int
+        :param prev_related: the related term of the term before the
+            classification
+        :type prev_related: str
+        :param sort_key: the active related term before the classification
+        :type sort_key: str
+        :param related_count: the number of related terms before the
+            classification or None if unknown
+        :type related_count: int or None
+        :param last_order: the last classification order before the
+            classification or None if unknown
+        :type last_order: int or None
+        :param from_front: if True, the term was in the front of the queue
+        :type from_front: bool
+        :param front: the front of the queue before the classification, if it
+            was rebuilt by the classification. Default: None
+        :type front: list[Term] or None
+        :param group: all the terms classified by a bulk action, term is the
+            first one. Default: None
+        :type group: list[Term] or None
+        :param orders: the orders assigned to the terms of group.
+            Default: None
+        :type orders: range or None
+        """
+        self.term = term
+        self.label = label
+        self.prev_label = prev_label
+        self.prev_order = prev_order
+        self.prev_related = prev_related
+        self.sort_key = sort_key
+        self.related_count = related_count
+        self.last_order = last_order
+        self.from_front = from_front
+        self.front = front
+        self.group = group
+        self.orders = orders
+
+    @staticmethod
+    def from_term(term, review):
+        """
+        Rebuilds the Operation that classified a term from its service data
+
+        :param term: the classified term
+        :type term: Term
+        :param review: the label of the terms to classify
+        :type review: Label
+        :return: the Operation
+        :rtype: Operation
+        """
+        return Operation(term, term.label, review, -1, '', term.related,
+                         None, None, False)
+
+
 class Fawoc:
     def __init__(self, args, terms, review, gui, profiler, logger):
         """
         The fawoc application logic
 
+        If terms is None, the application starts without terms, and the keys
+        that need them are disabled until the terms are set with load or
+        load_in_background.
+
         :param args: command line arguments
         :type args: argparse.Namespace
         :param terms: list of terms
-        :type terms: TermList
+        :type terms: TermList or None
         :param review: label to review
         :type review: Label
         :param gui: gui object of the application
@@ -607,20 +795,94 @@ class Fawoc:
                                full_screen=True)
         self.args = args
         self.gui = gui
-        self.terms = terms
+        self.terms = None
         self.review = review
+        self.profiler = profiler
+        self.logger = logger
+        self.saver = SaveWorker(logger)
+        self.timings = Timings()
+        self._stats_labels = self._init_stats_labels()
+        self.evaluated_word = None
+        # operation log of the classifications done in this session
+        self.history = []
+        # classifications undone, that can be redone
+        self.redo_log = []
+        self.loaded = False
+        self.save_count = 0
+        if terms is not None:
+            self.load(terms)
+
+    def load(self, terms):
+        """
+        Sets the terms to classify and shows them
+
+        :param terms: list of terms
+        :type terms: TermList
+        """
+        self._init_state(terms)
+        self._show_state()
+
+    def load_in_background(self, loading, preview):
+        """
+        Shows a preview of the terms while they are loaded in background
+
+        The preview is shown immediately. When loading is done, the terms are
+        prepared in background too, and then they are shown by the event loop
+        of the application. If loading fails, the application exits: the error
+        is available from loading itself.
+        Must be called before running the application.
+
+        :param loading: the future that gives the loaded list of terms
+        :type loading: concurrent.futures.Future
+        :param preview: the first terms of the input file
+        :type preview: TermList
+        """
+        if self.review == Label.labels['NONE']:
+            to_classify = preview.get_not_classified()
+        else:
+            to_classify = preview.get_from_label(self.review)
 
+        self.gui.set_terms(TermQueue(to_classify.items), '')
+        self.gui.set_stats(['Loading the terms...'])
+
+        async def wait_terms():
+            try:
+                terms = await asyncio.wrap_future(loading)
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self._init_state, terms)
+            except Exception:
+                self.app.exit()
+                return
+
+            self._show_state()
+            self.app.invalidate()
+
+        self.app.pre_run_callables.append(
+            lambda: self.app.create_background_task(wait_terms()))
+
+    def _init_state(self, terms):
+        """
+        Initializes the classification state from the terms
+
+        This method does not touch the gui, so it can be run in a thread
+        different from the one of the application.
+
+        :param terms: list of terms
+        :type terms: TermList
+        """
+        self.terms = terms
+        review = self.review
         last_word = terms.get_last_classified_term()
-        self.postponed = terms.get_from_label(Label.labels['POSTPONED'])
         if last_word is None:
             self.last_classified_order = -1
             related = 0
             sort_key = ''
             if review == Label.labels['NONE']:
-                self.to_classify = terms.get_not_classified()
+                to_classify = terms.get_not_classified()
             else:
-                self.to_classify = terms.get_from_label(review, order_set=False)
-                self.to_classify.sort_by_index()
+                to_classify = terms.get_from_label(review, order_set=False)
+
+            self.to_classify = TermQueue(to_classify.items)
         else:
             self.last_classified_order = last_word.order
             sort_key = last_word.related
@@ -629,21 +891,31 @@ class Fawoc:
 
             cont, not_cont = terms.return_related_items(sort_key, label=review)
             related = len(cont)
-            self.to_classify = cont + not_cont
+            self.to_classify = TermQueue(cont.items + not_cont.items)
+            self.to_classify.promote(cont.items)
 
-        cls = terms.get_classified()
-        if review != Label.labels['NONE']:
-            self.postponed = terms.get_from_label(Label.labels['POSTPONED'],
-                                                  order_set=True)
-            cls = TermList([t for t in cls.items if t.order >= 0])
+        postponed = Label.labels['POSTPONED']
+        if review == Label.labels['NONE']:
+            self.postponed = terms.get_from_label(postponed)
+            classified = terms.view().filter(
+                lambda t: t.is_classified() and t.label != postponed)
+        else:
+            self.postponed = terms.get_from_label(postponed, order_set=True)
+            classified = terms.view().filter(
+                lambda t: (t.order >= 0 and t.is_classified()
+                           and t.label != postponed))
 
-        self.classified = cls - self.postponed
+        # the only copy of the classified terms
+        self.classified = TermList(classified.items)
 
         if review == Label.labels['NONE']:
             self.n_terms = len(terms)
         else:
-            self.n_terms = len(terms.get_from_label(review)) + len(cls)
+            self.n_terms = (terms.count_by_label(review)
+                            + len(self.classified) + len(self.postponed))
 
+        self.history = []
+        self.redo_log = []
         self._get_next_word()
         self.related_count = related
         if related > 0:
@@ -652,8 +924,11 @@ class Fawoc:
             self.sort_word_key = ''
 
         self.last_word = last_word
-        self.profiler = profiler
-        self.logger = logger
+
+    def _show_state(self):
+        """
+        Shows the classification state and enables the keys
+        """
         self.gui.assign_labeled_terms(self.classified, self.postponed)
         if self.last_word is None:
             self.gui.refresh_label_windows('', Label.labels['NONE'])
@@ -663,9 +938,9 @@ class Fawoc:
 
         self.gui.set_terms(self.to_classify, self.sort_word_key)
         self.gui.set_stats(self.get_stats_strings())
-        self.save_count = 0
+        self.loaded = True
 
-    def add_key_binding(self, keys, handler):
+    def add_key_binding(self, keys, handler, need_terms=True):
         """
         Adds keybinding to Fawoc.
 
@@ -676,8 +951,14 @@ class Fawoc:
         :type keys: list[str]
         :param handler: function to be call
         :type handler: Callable[[KeyPressEvent], None]
+        :param need_terms: if True (the default) the keys are disabled until
+            the terms are loaded
+        :type need_terms: bool
         """
-        filt = Condition(lambda: not self.gui.help_shown)
+        if need_terms:
+            filt = Condition(lambda: not self.gui.help_shown and self.loaded)
+        else:
+            filt = Condition(lambda: not self.gui.help_shown)
         for k in keys:
             if len(k) == 1:
                 if k.islower():
@@ -694,39 +975,61 @@ class Fawoc:
         if self.evaluated_word is None:
             return
 
-        n = len(self.evaluated_word.string.split())
+        timer = self.timings.start('autonoise')
+        n = self.evaluated_word.ntokens
         auto = []
-        for t in self.to_classify.items:
-            if len(t.string.split()) != n:
+        for t in self.to_classify:
+            if t.ntokens != n:
                 break
 
-            t.label = Label.labels['AUTONOISE']
-            self.last_classified_order += 1
-            t.related = self.sort_word_key
-            t.order = self.last_classified_order
-            auto.append(t.string)
-            msg = f"WORD \'{t.string}\' AS \'{Label.labels['AUTONOISE']}\'"
-            self.profiler.info(msg)
-            self.classified.items.append(t)
-
-        ret = self.terms.return_related_items(self.sort_word_key,
-                                              label=self.review)
-        containing, not_containing = ret
-        self.related_count = len(containing)
+            auto.append(t)
+
+        label = Label.labels['AUTONOISE']
+        op = self._new_operation(auto[0], label,
+                                 front=self.to_classify.get_front())
+        op.group = auto
+        op.orders = range(self.last_classified_order + 1,
+                          self.last_classified_order + 1 + len(auto))
+        for _ in auto:
+            self.to_classify.pop()
+
+        self.terms.classify_items(auto, label, self.last_classified_order + 1,
+                                  self.sort_word_key)
+        self.last_classified_order += len(auto)
+        for t in auto:
+            self.classified.append(t)
+
+        self._log_operation(op)
+
+        msg = "{} WORDS OF {} TOKENS AS '{}' FROM '{}' TO '{}'"
+        self.profiler.info(msg.format(len(auto), n, label[0], auto[0].string,
+                                      auto[-1].string))
+        timer.lap('state')
+        # the run only removes terms from the queue: the related terms are
+        # the ones left in the front
+        if self.sort_word_key == '':
+            self.to_classify.reset()
+            self.related_count = 0
+        else:
+            self.to_classify.sort_front()
+            self.related_count = self.to_classify.front_size()
+
         if self.related_count == 0:
             self.sort_word_key = ''
 
-        self.to_classify = containing + not_containing
-        self.last_word = self.classified.items[-1]
+        timer.lap('related')
+        self.last_word = auto[-1]
         stats = self.get_stats_strings()
         self.gui.update_windows(self.to_classify, self.classified,
                                 self.postponed, self.last_word,
                                 self.sort_word_key, stats)
-
+        timer.lap('gui')
         if not self.args.dry_run and not self.args.no_auto_save:
             self.save_terms()
 
         self._get_next_word()
+        timer.lap('save')
+        timer.done()
 
     def do_classify(self, label):
         """
@@ -739,26 +1042,30 @@ class Fawoc:
         if self.evaluated_word is None:
             return
 
-        t0 = time.time()
+        timer = self.timings.start('classify')
         self.profiler.info("WORD '{}' AS '{}'".format(self.evaluated_word.string,
                                                       label[0]))
+        front = None
+        if self.related_count <= 0:
+            # the front is rebuilt below
+            front = self.to_classify.get_front()
+
+        op = self._new_operation(self.evaluated_word, label, front=front)
 
-        self.evaluated_word.label = label
         self.last_classified_order += 1
-        self.evaluated_word.order = self.last_classified_order
-        self.evaluated_word.related = self.sort_word_key
-        del self.to_classify.items[0]
+        self.terms.classify_item(self.evaluated_word, label,
+                                 self.last_classified_order,
+                                 self.sort_word_key)
+        self.to_classify.pop()
         self.related_count -= 1
-        t1 = time.time()
-        self.logger.debug("do_classify time 0 {}".format(t1 - t0))
+        self._log_operation(op)
+        timer.lap('state')
 
-        t0 = time.time()
         if self.related_count < 0:
             self.sort_word_key = self.evaluated_word.string
-            ret = self.to_classify.return_related_items(self.sort_word_key,
-                                                        label=self.review)
-            containing, not_containing = ret
-            self.to_classify = containing + not_containing
+            containing = self.terms.get_related_items(self.sort_word_key,
+                                                      label=self.review)
+            self.to_classify.promote(containing.items)
             # the sort_word_key has been changed: reload the related count
             self.related_count = len(containing)
 
@@ -767,27 +1074,21 @@ class Fawoc:
             # reset the related machinery
             self.sort_word_key = ''
 
-        t1 = time.time()
-        self.logger.debug("do_classify time 1 {}".format(t1 - t0))
-
-        t0 = time.time()
+        timer.lap('related')
         self.last_word = self.evaluated_word
 
-        self.classified.items.append(self.evaluated_word)
+        self.classified.append(self.evaluated_word)
         stats = self.get_stats_strings()
         self.gui.update_windows(self.to_classify, self.classified,
                                 self.postponed, self.last_word,
                                 self.sort_word_key, stats)
-        t1 = time.time()
-        self.logger.debug("do_classify time 2 {}".format(t1 - t0))
-
-        t0 = time.time()
+        timer.lap('gui')
         if not self.args.dry_run and not self.args.no_auto_save:
             self.save_terms()
 
         self._get_next_word()
-        t1 = time.time()
-        self.logger.debug("do_classify time 3 {}".format(t1 - t0))
+        timer.lap('save')
+        timer.done()
 
     def do_postpone(self):
         """
@@ -796,138 +1097,318 @@ class Fawoc:
         if self.evaluated_word is None:
             return
 
+        timer = self.timings.start('postpone')
         msg = "WORD '{}' POSTPONED".format(self.evaluated_word.string)
         self.profiler.info(msg)
+        op = self._new_operation(self.evaluated_word,
+                                 Label.labels['POSTPONED'],
+                                 front=self.to_classify.get_front())
         # classification: POSTPONED
-        self.evaluated_word.label = Label.labels['POSTPONED']
         self.last_classified_order += 1
-        self.evaluated_word.order = self.last_classified_order
-        self.evaluated_word.related = self.sort_word_key
+        self.terms.classify_item(self.evaluated_word,
+                                 Label.labels['POSTPONED'],
+                                 self.last_classified_order,
+                                 self.sort_word_key)
+        self.to_classify.pop()
+        self._log_operation(op)
+        timer.lap('state')
 
         self.related_count -= 1
         if self.related_count > 0:
-            cont, not_cont = self.terms.return_related_items(self.sort_word_key,
-                                                             self.review)
-            self.to_classify = cont + not_cont
+            cont = self.terms.get_related_items(self.sort_word_key,
+                                                self.review)
+            self.to_classify.promote(cont.items)
         else:
-            self.to_classify = self.terms.get_from_label(self.review)
+            self.to_classify.reset()
             # reset related machinery
             self.related_count = 0
             self.sort_word_key = ''
 
+        timer.lap('related')
         self.last_word = self.evaluated_word
-        self.postponed.items.append(self.evaluated_word)
+        self.postponed.append(self.evaluated_word)
         stats = self.get_stats_strings()
         self.gui.update_windows(self.to_classify, self.classified,
                                 self.postponed, self.last_word,
                                 self.sort_word_key, stats)
-
+        timer.lap('gui')
         if not self.args.dry_run and not self.args.no_auto_save:
             self.save_terms()
 
         self._get_next_word()
+        timer.lap('save')
+        timer.done()
 
     def _get_next_word(self):
         """
         Handle the evaluated word
         """
-        if len(self.to_classify) <= 0:
-            self.evaluated_word = None
-        else:
-            self.evaluated_word = self.to_classify.items[0]
+        self.evaluated_word = self.to_classify.first()
+
+    def _new_operation(self, term, label, front=None, from_front=None):
+        """
+        Creates the Operation that records the classification of term
+
+        Must be called before any change to the state.
+
+        :param term: the term to classify
+        :type term: Term
+        :param label: the label to assign
+        :type label: Label
+        :param front: the front of the queue, if the classification rebuilds
+            it. Default: None
+        :type front: list[Term] or None
+        :param from_front: if the term is in the front of the queue. If None
+            (the default) it is given by the queue
+        :type from_front: bool or None
+        :return: the Operation
+        :rtype: Operation
+        """
+        if from_front is None:
+            from_front = self.to_classify.front_size() > 0
+
+        return Operation(term, label, term.label, term.order, term.related,
+                         self.sort_word_key, self.related_count,
+                         self.last_classified_order, from_front, front)
+
+    def _log_operation(self, op):
+        """
+        Appends an operation to the log, discarding the ones to redo
+
+        :param op: the operation
+        :type op: Operation
+        """
+        self.history.append(op)
+        self.redo_log.clear()
+
+    def _last_operation(self):
+        """
+        Gives the last operation to undo
+
+        When the log of the session is empty, the operation is rebuilt from
+        the last classified term.
+
+        :return: the last operation or None if no term is classified
+        :rtype: Operation or None
+        """
+        if len(self.history) > 0:
+            return self.history[-1]
+
+        term = self.terms.get_last_classified_term()
+        if term is None:
+            return None
+
+        return Operation.from_term(term, self.review)
 
     def undo(self):
         """
         Handles the undo process
         """
-        self.last_word = self.terms.get_last_classified_term()
-        if self.last_word is None:
+        op = self._last_operation()
+        if op is None:
             return
 
-        label = self.last_word.label
-        if label == Label.labels['AUTONOISE']:
-            for t in reversed(list(self.classified.items)):
-                if t.label == Label.labels['AUTONOISE']:
-                    self._undo_single()
-                else:
-                    break
+        timer = self.timings.start('undo')
+        if op.related_count is None and op.label == Label.labels['AUTONOISE']:
+            # rebuilt from the service data: the autonoise runs are not known,
+            # undo all the last autonoise terms
+            first = op
+            while op is not None and op.label == Label.labels['AUTONOISE']:
+                self._undo_single(op)
+                first = op
+                op = self._last_operation()
         else:
-            self._undo_single()
+            self._undo_single(op)
+            first = op
 
+        self.redo_log.append(first)
+        self.last_word = self.terms.get_last_classified_term()
+        timer.lap('state')
         stats = self.get_stats_strings()
         self.gui.update_windows(self.to_classify, self.classified,
                                 self.postponed, self.last_word,
                                 self.sort_word_key, stats)
-
+        timer.lap('gui')
         if not self.args.dry_run and not self.args.no_auto_save:
             self.save_terms()
 
         self._get_next_word()
+        timer.lap('save')
+        timer.done()
 
-    def _undo_single(self):
+    def _undo_single(self, op):
         """
         Handle the undo of a single term
+
+        :param op: the last operation, as given by _last_operation
+        :type op: Operation
         """
-        self.last_word = self.terms.get_last_classified_term()
-        if self.last_word is None:
-            return
+        if len(self.history) > 0 and self.history[-1] is op:
+            self.history.pop()
+
+        term = op.term
+        label = term.label
+        related = term.related
+        order = term.order
+        if op.group is None:
+            group = [term]
+            msg = 'Undo: {} group {} order {}'.format(term.string, label,
+                                                      order)
+        else:
+            group = op.group
+            msg = 'Undo: {} terms group {} orders {}-{}'.format(
+                len(group), label, op.orders.start, op.orders.stop - 1)
 
-        label = self.last_word.label
-        related = self.last_word.related
-        msg = 'Undo: {} group {} order {}'.format(self.last_word.string, label,
-                                                  self.last_word.order)
         self.logger.debug(msg)
-
+        strings = [t.string for t in group]
         if label == Label.labels['POSTPONED']:
-            self.postponed.remove([self.last_word.string])
+            self.postponed.remove(strings)
         else:
-            self.classified.remove([self.last_word.string])
+            self.classified.remove(strings)
 
-        # un-mark self.last_word
-        self.last_classified_order = self.last_word.order
-        self.last_word.label = self.review
-        self.last_word.order = -1
-        self.last_word.related = ''
+        # un-mark the terms: they are passed as Terms, since their strings
+        # can be repeated
+        if op.group is None:
+            self.terms.classify_item(term, op.prev_label, op.prev_order,
+                                     op.prev_related)
+        else:
+            self.terms.classify_items(group, op.prev_label, op.prev_order,
+                                      op.prev_related)
+
+        if op.related_count is not None:
+            # restore the state recorded by the operation
+            if op.front is not None:
+                self.to_classify.reset()
+                for t in group:
+                    self.to_classify.insert(t)
+
+                self.to_classify.promote(op.front)
+            elif op.from_front:
+                self.to_classify.push_front(term)
+            else:
+                self.to_classify.insert(term)
 
-        # handle related word
+            self.sort_word_key = op.sort_key
+            self.related_count = op.related_count
+            self.last_classified_order = op.last_order
+        else:
+            # operation rebuilt from the service data: rebuild the state
+            self._undo_related(term, related)
+            self.last_classified_order = order
+
+        if op.group is None:
+            self.profiler.info("WORD '{}' UNDONE".format(term.string))
+        else:
+            msg = "{} WORDS FROM '{}' TO '{}' UNDONE"
+            self.profiler.info(msg.format(len(group), group[0].string,
+                                          group[-1].string))
+
+    def _undo_related(self, term, related):
+        """
+        Rebuilds the related terms after the undo of term
+
+        :param term: the term undone
+        :type term: Term
+        :param related: the related term of term before the undo
+        :type related: str
+        """
         if related == self.sort_word_key:
             self.related_count += 1
-            self.to_classify.items.insert(0, self.last_word)
-        elif self.sort_word_key == self.last_word.string:
+            self.to_classify.push_front(term)
+        elif self.sort_word_key == term.string:
             # the sort_word_key is the word undone: reset the related machinery
             self.sort_word_key = ''
             self.related_count = 0
-            self.to_classify.sort_by_index()
-            self.to_classify.items.insert(0, self.last_word)
+            self.to_classify.reset()
+            self.to_classify.push_front(term)
         else:
             self.sort_word_key = related
-            ret = self.terms.return_related_items(self.sort_word_key,
-                                                  label=self.review)
-            containing, not_containing = ret
+            self.to_classify.insert(term)
+            containing = self.terms.get_related_items(self.sort_word_key,
+                                                      label=self.review)
             self.related_count = len(containing)
-            self.to_classify = containing + not_containing
+            self.to_classify.promote(containing.items)
 
         if self.sort_word_key == '':
             # if self.sort_word_key is empty there's no related item: fix the
             # related_items_count to the correct value of 0
             self.related_count = 0
 
-        self.profiler.info("WORD '{}' UNDONE".format(self.last_word.string))
-        self.last_word = self.terms.get_last_classified_term()
+    def redo(self):
+        """
+        Redoes the last classification undone
+
+        The classification is redone only if its term is the evaluated one.
+        Otherwise, the classifications to redo are discarded.
+        """
+        if len(self.redo_log) == 0:
+            return
+
+        op = self.redo_log.pop()
+        # the terms are matched by index: see Term
+        word = self.evaluated_word
+        if word is None or op.term.index != word.index:
+            self.redo_log.clear()
+            return
+
+        # the classification must not discard the other ones to redo
+        redo_log = self.redo_log
+        self.redo_log = []
+        if op.label == Label.labels['AUTONOISE']:
+            self.do_autonoise()
+        elif op.label == Label.labels['POSTPONED']:
+            self.do_postpone()
+        else:
+            self.do_classify(op.label)
+
+        self.redo_log = redo_log
 
     def save_terms(self, bypass=False):
         """
         Saves the terms to file
 
+        The data to save is copied here, and written by a background thread,
+        so the key handlers are not blocked by the disk.
         :param bypass: if True, the method saves the data without check on save_count
         :type bypass: bool
         """
         self.save_count += 1
         if bypass or self.save_count >= SAVE_COUNT_THRESHOLD:
-            self.terms.to_tsv(self.args.datafile)
-            self.terms.save_service_data(self.args.datafile)
+            datafile = self.args.datafile
+            self.saver.submit(self.terms.tsv_job(datafile, incremental=True))
+            job = self.terms.service_data_job(datafile, compact=False)
+            self.saver.submit(job)
             self.save_count = 0
 
+    def close(self):
+        """
+        Waits for the pending saves to be written
+        """
+        self.saver.close()
+
+    @staticmethod
+    def _init_stats_labels():
+        """
+        Prepares the fixed part of the statistics of each label
+
+        :return: the name of each label and its padded heading
+        :rtype: list[tuple[str, str]]
+        """
+        my_labels = ['Total words', 'To do', 'Related']
+        label_labels = [Label.labels[lab][0] for lab in Label.labels]
+        label_labels = [x for x in label_labels if x != '']
+        all_labels = my_labels + label_labels
+        max_len = max(len(x) for x in all_labels)
+        stats_labels = []
+        for lab, tup in Label.labels.items():
+            if tup[0] == '':
+                continue
+            keybinding = tup[1]
+            padded_label = tup[0] + (' ' * (max_len - len(tup[0]) + 2))
+            stats_labels.append((tup[0], f'[{keybinding}] {padded_label}'))
+
+        return stats_labels
+
     def get_stats_strings(self):
         """
         Calculates the statistics and formats them into strings
@@ -940,27 +1421,16 @@ class Fawoc:
         count = self.classified.count_labels()
         n_completed = sum(count.values())
 
-        # TODO: this should be done only once at initialization
-        my_labels = ['Total words', 'To do', 'Related']
-        label_labels = [Label.labels[lab][0] for lab in Label.labels]
-        label_labels = [x for x in label_labels if x != '']
-        all_labels = my_labels + label_labels
-        max_len = max(len(x) for x in all_labels)
-
         stats_strings.append(f'Total words       {self.n_terms:7}')
         avg = avg_or_zero(n_completed, self.n_terms)
         stats_strings.append(f'Completed         {n_completed:7} ({avg:6.2f}%)')
         avg = avg_or_zero(n_to_do, self.n_terms)
         stats_strings.append(f'To do             {n_to_do:7} ({avg:6.2f}%)')
 
-        for lab, tup in Label.labels.items():
-            if tup[0] == '':
-                continue
-            n = count[tup[0]]
-            keybinding = tup[1]
+        for name, heading in self._stats_labels:
+            n = count[name]
             avg = avg_or_zero(n, n_completed)
-            padded_label = tup[0] + (' ' * (max_len - len(tup[0]) + 2))
-            stats_strings.append(f'[{keybinding}] {padded_label}{n:7} ({avg:6.2f}%)')
+            stats_strings.append(f'{heading}{n:7} ({avg:6.2f}%)')
 
         # avg = avg_or_zero(n_keywords, n_completed)
         # stats_strings.append(f'  Keyword    {n_keywords:7} ({avg:6.2f}%)')
@@ -1017,8 +1487,16 @@ def init_argparser():
                         help='disable loading/saving of the file with the '
                              'additional informations about the term.',
                         cli_only=True)
+    parser.add_argument('--backend', choices=['tsv', 'sqlite'],
+                        default='tsv',
+                        help='storage of the terms during the session. With '
+                             'sqlite the terms are kept in a database next '
+                             'to the input file. Default %(default)r')
     parser.add_argument('--no-profile', action='store_true', dest='no_profile',
                         help='disable profiling logging')
+    parser.add_argument('--timings-file', action='store', dest='timings_file',
+                        help='json file where the timings of the actions are '
+                             'written on exit')
     parser.add_argument('--version', '-v', action='version',
                         version=f'%(prog)r version: {__version__}')
     wmin = 40
@@ -1051,6 +1529,75 @@ Must be in range [{wmin}, {wmax}]. Default {wdef} columns"""
     return parser
 
 
+def init_rules_argparser():
+    """
+    Initialize the command line parser of the apply-rules command.
+
+    :return: the command line parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = ArgParse(prog='fawoc apply-rules',
+                      description='label the terms not classified that match '
+                                  'the rules, without the user interface')
+    parser.add_argument('datafile', action="store", type=str,
+                        help="input CSV data file", input=True)
+    parser.add_argument('rules', action="store", type=str,
+                        help="json file with the rules", input=True)
+    parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                        help='do not write the results')
+    parser.add_argument('--no-info-file', action='store_true',
+                        dest='no_info_file',
+                        help='disable loading/saving of the file with the '
+                             'additional informations about the term.',
+                        cli_only=True)
+    return parser
+
+
+def init_merge_argparser():
+    """
+    Initialize the command line parser of the merge command.
+
+    :return: the command line parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = ArgParse(prog='fawoc merge',
+                      description='merge the labels of several annotated '
+                                  'copies of the same datafile')
+    parser.add_argument('datafiles', action="store", type=str, nargs='+',
+                        help="input CSV data files of the copies. The terms "
+                             "are written in the order of the first one",
+                        input=True)
+    parser.add_argument('--output', '-o', action='store', required=True,
+                        help='output CSV data file with the merged labels',
+                        output=True)
+    parser.add_argument('--report', '-r', action='store',
+                        default='conflicts.tsv',
+                        help='tsv file with the terms labelled differently by '
+                             'the copies. Default %(default)r')
+    parser.add_argument('--jobs', '-j', action='store', type=int,
+                        help='number of processes that load the copies. '
+                             'Default: the number of cpus')
+    return parser
+
+
+def init_graph_argparser():
+    """
+    Initialize the command line parser of the build-graph command.
+
+    :return: the command line parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = ArgParse(prog='fawoc build-graph',
+                      description='precompute the terms related to each term '
+                                  'of the datafile')
+    parser.add_argument('datafile', action="store", type=str,
+                        help="input CSV data file", input=True)
+    parser.add_argument('--jobs', '-j', action='store', type=int,
+                        help='number of processes that compute the graph. '
+                             'Default: the number of cpus')
+    return parser
+
+
 def avg_or_zero(num, den):
     """
     Safely calculates an average, returning 0 if no elements are present.
@@ -1117,6 +1664,18 @@ def undo_kb(event: KeyPressEvent, fawoc: Fawoc):
     fawoc.undo()
 
 
+def redo_kb(event: KeyPressEvent, fawoc: Fawoc):
+    """
+    Callback for the redo key
+
+    :param event: prompt_toolkit event associate to the key pressed
+    :type event: KeyPressEvent
+    :param fawoc: fawoc object
+    :type fawoc: Fawoc
+    """
+    fawoc.redo()
+
+
 def save_kb(event: KeyPressEvent, fawoc: Fawoc):
     """
     Callback for the save key
@@ -1127,7 +1686,10 @@ def save_kb(event: KeyPressEvent, fawoc: Fawoc):
     :type fawoc: Fawoc
     """
     if not fawoc.args.dry_run:
+        timer = fawoc.timings.start('save')
         fawoc.save_terms(bypass=True)
+        timer.lap('save')
+        timer.done()
 
 
 def quit_kb(event: KeyPressEvent):
@@ -1144,42 +1706,124 @@ def help_kb(event: KeyPressEvent, fawoc: Fawoc):
     fawoc.gui.show_help()
 
 
-def fawoc_main(terms, args, review, last_reviews, logger=None, profiler=None):
+def timings_kb(event: KeyPressEvent, fawoc: Fawoc):
     """
-    Main loop
+    Callback for the timings key
+
+    :param event: prompt_toolkit event associate to the key pressed
+    :type event: KeyPressEvent
+    :param fawoc: fawoc object
+    :type fawoc: Fawoc
+    """
+    fawoc.gui.toggle_timings(fawoc.timings)
+
+
+def load_terms(args, review, profiler):
+    """
+    Loads the terms and the service data of the datafile
+
+    The terms are loaded from the snapshot cache of the datafile if it is up
+    to date. The order of the terms is reset if the review label is changed
+    since the last review on the same datafile or if a review ended.
 
-    :param terms: list of terms
-    :type terms: TermList
     :param args: command line arguments
     :type args: argparse.Namespace
     :param review: label to review if any
     :type review: Label
-    :param last_reviews: last reviews performed. key: csv abs path; val: reviewed
-        label name
-    :type last_reviews: dict[str, str]
-    :param logger: debug logger. Default: None
-    :type logger: logging.Logger or None
-    :param profiler: profiler logger. Default None
-    :type profiler: logging.Logger or None
+    :param profiler: profiler logger
+    :type profiler: logging.Logger
+    :return: the terms and the last reviews performed (key: csv abs path;
+        val: reviewed label name)
+    :rtype: (TermList, dict[str, str])
+    :raise InvalidServiceDataError: if the service data are invalid
+    :raise InvalidTsvError: if two terms of the datafile have the same id
     """
     datafile = args.datafile
-    reset = False
+    if args.backend == 'sqlite':
+        terms = SqliteTermList.open(datafile,
+                                    load_invariant=not args.no_info_file,
+                                    readonly=args.dry_run)
+    else:
+        terms = TermList.load_cache(datafile,
+                                    load_invariant=not args.no_info_file)
+
+    if terms is None:
+        terms = TermList()
+        terms.from_tsv(datafile)
+        terms.load_service_data(datafile,
+                                load_invariant=not args.no_info_file)
+        # now order is properly loaded - sort terms by order
+        terms.sort_by_order()
+
+    try:
+        graph = load_graph(datafile, terms)
+    except InvalidGraphError as err:
+        profiler.info("INVALID GRAPH: {}".format(err.args[0]))
+        graph = None
+
+    if graph is not None:
+        terms.set_graph(graph)
+        profiler.info("GRAPH: {} TERMS".format(len(graph)))
+
+    profiler.info("CLASSIFIED: {}".format(terms.count_classified()))
+    # check the last_review file
+    try:
+        with open('last_review.json') as file:
+            last_reviews = json.load(file)
+    except FileNotFoundError:
+        # no file to care about
+        last_reviews = dict()
+
     if review != Label.labels['NONE']:
+        label = review[0]
         # review mode: check last_reviews
         if review[0] != last_reviews.get(datafile, ''):
-            reset = True
+            terms.clear_order()
+    else:
+        label = 'NONE'
+        if datafile in last_reviews:
+            # remove the last review on the same csv
+            del last_reviews[datafile]
+            if len(last_reviews) <= 0:
+                try:
+                    os.unlink('last_review.json')
+                except FileNotFoundError:
+                    pass
+            # also reset order and related
+            terms.clear_order()
+
+    profiler.info("INPUT LABEL: {}".format(label))
+    return terms, last_reviews
+
 
-        if reset:
-            for w in terms.items:
-                w.order = -1
-                w.related = ''
+def fawoc_main(loading, preview, args, review, logger=None, profiler=None):
+    """
+    Main loop
 
+    The preview is shown until the terms are loaded.
+
+    :param loading: the future that gives the terms (see load_terms)
+    :type loading: concurrent.futures.Future
+    :param preview: the first terms of the datafile
+    :type preview: TermList
+    :param args: command line arguments
+    :type args: argparse.Namespace
+    :param review: label to review if any
+    :type review: Label
+    :param logger: debug logger. Default: None
+    :type logger: logging.Logger or None
+    :param profiler: profiler logger. Default None
+    :type profiler: logging.Logger or None
+    """
     win_width = args.width
     rows = 14
     terms_rows = 24
 
     gui = Gui(win_width, terms_rows, rows, review, args.no_info_file)
-    fawoc = Fawoc(args, terms, review, gui, profiler, logger)
+    fawoc = Fawoc(args, None, review, gui, profiler, logger)
+    terms = concurrent.futures.Future()
+    loading.add_done_callback(lambda f: _chain_terms(f, terms))
+    fawoc.load_in_background(terms, preview)
 
     classifing_keys = Label.get_classifying_keybindings()
 
@@ -1187,12 +1831,41 @@ def fawoc_main(terms, args, review, last_reviews, logger=None, profiler=None):
     fawoc.add_key_binding(['a'], lambda e: autonoise_kb(e, fawoc))
     fawoc.add_key_binding(['p'], lambda e: postpone_kb(e, fawoc))
     fawoc.add_key_binding(['u'], lambda e: undo_kb(e, fawoc))
+    fawoc.add_key_binding(['y'], lambda e: redo_kb(e, fawoc))
     fawoc.add_key_binding(['w'], lambda e: save_kb(e, fawoc))
-    fawoc.add_key_binding(['q'], quit_kb)
-    fawoc.add_key_binding(['?'], lambda e: help_kb(e, fawoc))
+    fawoc.add_key_binding(['t'], lambda e: timings_kb(e, fawoc),
+                          need_terms=False)
+    fawoc.add_key_binding(['q'], quit_kb, need_terms=False)
+    fawoc.add_key_binding(['?'], lambda e: help_kb(e, fawoc),
+                          need_terms=False)
     filt = Condition(lambda: fawoc.gui.help_shown)
     fawoc.keybindings.add('<any>', filter=filt)(lambda e: fawoc.gui.hide_help())
-    fawoc.app.run()
+    try:
+        fawoc.app.run()
+    finally:
+        fawoc.close()
+        if args.timings_file is not None:
+            fawoc.timings.dump(args.timings_file)
+
+
+def _chain_terms(loading, terms):
+    """
+    Sets the result of terms with the TermList given by loading
+
+    :param loading: the future that runs load_terms
+    :type loading: concurrent.futures.Future
+    :param terms: the future that gives only the TermList
+    :type terms: concurrent.futures.Future
+    """
+    if not terms.set_running_or_notify_cancel():
+        # the application is already closed
+        return
+
+    err = loading.exception()
+    if err is not None:
+        terms.set_exception(err)
+    else:
+        terms.set_result(loading.result()[0])
 
 
 def fawoc_run(args):
@@ -1202,10 +1875,10 @@ def fawoc_run(args):
         profile_log_level = logging.INFO
 
     profiler_logger = setup_logger('profiler_logger', args.profiler_name,
-                                   level=profile_log_level)
+                                   level=profile_log_level, queued=True)
     global debug_logger
     debug_logger = setup_logger('debug_logger', args.logfile,
-                                level=logging.DEBUG)
+                                level=logging.DEBUG, queued=True)
 
     if args.input is not None:
         try:
@@ -1222,9 +1895,10 @@ def fawoc_run(args):
     profiler_logger.info("DATAFILE: '{}'".format(datafile_path))
     # use the absolute path
     args.datafile = datafile_path
-    terms = TermList()
+    # the first rows are shown while the whole file is loaded in background
+    preview = TermList()
     try:
-        _, _ = terms.from_tsv(args.datafile)
+        _, _ = preview.from_tsv(args.datafile, max_rows=PREVIEW_ROWS)
     except FileNotFoundError:
         msg = 'Error: file {!r} not found'
         sys.exit(msg.format(args.datafile))
@@ -1236,47 +1910,24 @@ def fawoc_run(args):
             # probably this else is unreachable, but in any case is better to
             # re-raise this exception for debug
             raise
-
-    try:
-        terms.load_service_data(args.datafile, load_invariant=not args.no_info_file)
-    except InvalidServiceDataError as err:
-        msg = 'Error: service file {!r} is invalid: {}'
-        name = '_'.join([pathlib.Path(args.datafile).stem, 'fawoc_data.json'])
-        sys.exit(msg.format(name, err.args[0]))
-
-    # now order is properly loaded - sort terms by order
-    terms.sort_by_order()
-
-    profiler_logger.info("CLASSIFIED: {}".format(terms.count_classified()))
-    # check the last_review file
-    try:
-        with open('last_review.json') as file:
-            last_reviews = json.load(file)
-    except FileNotFoundError:
-        # no file to care about
-        last_reviews = dict()
-
-    if review != Label.labels['NONE']:
-        label = review[0]
-    else:
-        label = 'NONE'
-        if datafile_path in last_reviews:
-            # remove the last review on the same csv
-            del last_reviews[datafile_path]
-            if len(last_reviews) <= 0:
-                try:
-                    os.unlink('last_review.json')
-                except FileNotFoundError:
-                    pass
-            # also reset order and related
-            for t in terms.items:
-                t.order = -1
-                t.related = ''
-
-    profiler_logger.info("INPUT LABEL: {}".format(label))
-
-    fawoc_main(terms, args, review, last_reviews, logger=debug_logger,
-               profiler=profiler_logger)
+    except InvalidTsvError as err:
+        sys.exit('Error: file {!r} is invalid: {}'.format(args.datafile,
+                                                          err.args[0]))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        loading = executor.submit(load_terms, args, review, profiler_logger)
+        fawoc_main(loading, preview, args, review, logger=debug_logger,
+                   profiler=profiler_logger)
+        try:
+            terms, last_reviews = loading.result()
+        except InvalidServiceDataError as err:
+            msg = 'Error: service file {!r} is invalid: {}'
+            name = '_'.join([pathlib.Path(args.datafile).stem,
+                             'fawoc_data.json'])
+            sys.exit(msg.format(name, err.args[0]))
+        except InvalidTsvError as err:
+            sys.exit('Error: file {!r} is invalid: {}'.format(args.datafile,
+                                                              err.args[0]))
 
     profiler_logger.info("CLASSIFIED: {}".format(terms.count_classified()))
     profiler_logger.info("DATAFILE '{}'".format(datafile_path))
@@ -1293,14 +1944,155 @@ def fawoc_run(args):
         terms.to_tsv(args.datafile)
         terms.save_service_data(args.datafile,
                                 save_invariant=not args.no_info_file)
+        # the cache must give the same order of a load of the saved files
+        terms.sort_by_index()
+        terms.sort_by_order()
+        terms.save_cache(args.datafile, save_invariant=not args.no_info_file)
     profiler_logger.info("*** PROGRAM TERMINATED ***")
     debug_logger.info("*** FAWOC TERMINATED ***")
 
 
+def apply_rules_run(args):
+    """
+    Labels the terms of the datafile with the rules, without the gui
+
+    :param args: command line arguments of the apply-rules command
+    :type args: argparse.Namespace
+    """
+    try:
+        rules = load_rules(args.rules)
+    except FileNotFoundError:
+        sys.exit('Error: file {!r} not found'.format(args.rules))
+    except InvalidRulesError as err:
+        sys.exit('Error: rule file {!r} is invalid: {}'.format(args.rules,
+                                                                err.args[0]))
+
+    datafile = str(pathlib.Path(args.datafile).absolute())
+    terms = TermList.load_cache(datafile, load_invariant=not args.no_info_file)
+    if terms is None:
+        terms = TermList()
+        try:
+            terms.from_tsv(datafile)
+        except FileNotFoundError:
+            sys.exit('Error: file {!r} not found'.format(datafile))
+        except KeyError as err:
+            if err.args[0] == 'keyword':
+                msg = 'Error: file {!r} has not a term nor a keyword column'
+                sys.exit(msg.format(datafile))
+            else:
+                raise
+        except InvalidTsvError as err:
+            sys.exit('Error: file {!r} is invalid: {}'.format(datafile,
+                                                              err.args[0]))
+
+        try:
+            terms.load_service_data(datafile,
+                                    load_invariant=not args.no_info_file)
+        except InvalidServiceDataError as err:
+            msg = 'Error: service file {!r} is invalid: {}'
+            name = '_'.join([pathlib.Path(datafile).stem, 'fawoc_data.json'])
+            sys.exit(msg.format(name, err.args[0]))
+
+        terms.sort_by_order()
+
+    try:
+        counts = apply_rules(terms, rules)
+    except InvalidRulesError as err:
+        sys.exit('Error: rule file {!r} cannot be applied: {}'.format(
+            args.rules, err.args[0]))
+
+    for label, n in counts.items():
+        print(f'{label[0]}: {n}')
+
+    print(f'total: {sum(counts.values())}')
+    if not args.dry_run:
+        terms.to_tsv(datafile)
+        terms.save_service_data(datafile,
+                                save_invariant=not args.no_info_file)
+        # the cache must give the same order of a load of the saved files
+        terms.sort_by_index()
+        terms.sort_by_order()
+        terms.save_cache(datafile, save_invariant=not args.no_info_file)
+
+
+def merge_run(args):
+    """
+    Merges the labels of the copies of a datafile, without the gui
+
+    :param args: command line arguments of the merge command
+    :type args: argparse.Namespace
+    """
+    try:
+        merged, conflicts, missing = merge(args.datafiles, args.output,
+                                           args.report, jobs=args.jobs)
+    except FileNotFoundError as err:
+        sys.exit('Error: file {!r} not found'.format(err.filename))
+    except KeyError as err:
+        if err.args[0] == 'keyword':
+            msg = 'Error: file {!r} has not a term nor a keyword column'
+            sys.exit(msg.format(args.datafiles[0]))
+        else:
+            raise
+    except InvalidTsvError as err:
+        sys.exit('Error: invalid tsv file: {}'.format(err.args[0]))
+    except MergeError as err:
+        sys.exit('Error: {}'.format(err.args[0]))
+
+    print(f'terms: {merged}')
+    print(f'conflicts: {conflicts}')
+    if missing > 0:
+        print(f'classified terms not in {args.datafiles[0]!r}: {missing}')
+
+
+def build_graph_run(args):
+    """
+    Builds the containment graph of the datafile
+
+    :param args: command line arguments of the build-graph command
+    :type args: argparse.Namespace
+    """
+    datafile = str(pathlib.Path(args.datafile).absolute())
+    terms = TermList()
+    try:
+        terms.from_tsv(datafile)
+    except FileNotFoundError:
+        sys.exit('Error: file {!r} not found'.format(datafile))
+    except KeyError as err:
+        if err.args[0] == 'keyword':
+            msg = 'Error: file {!r} has not a term nor a keyword column'
+            sys.exit(msg.format(datafile))
+        else:
+            raise
+    except InvalidTsvError as err:
+        sys.exit('Error: file {!r} is invalid: {}'.format(datafile,
+                                                          err.args[0]))
+
+    graph = build_graph(terms, jobs=args.jobs)
+    path = graph_file(datafile)
+    graph.save(path)
+    print(f'terms: {len(graph)}')
+    print(f'edges: {len(graph.targets)}')
+    print(f'graph: {path}')
+
+
+# the commands of fawoc, besides the user interface: name -> parser and run
+COMMANDS = {
+    'apply-rules': (init_rules_argparser, apply_rules_run),
+    'merge': (init_merge_argparser, merge_run),
+    'build-graph': (init_graph_argparser, build_graph_run),
+}
+
+
 def main():
     """
     Main function
     """
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        init_parser, run = COMMANDS[sys.argv[1]]
+        args = init_parser().parse_args(sys.argv[2:])
+        run(args)
+        return
+
     parser = init_argparser()
     args = parser.parse_args()
     fawoc_run(args)
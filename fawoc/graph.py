@@ -0,0 +1,358 @@
+import bisect
+import concurrent.futures
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+
+import utils
+from terms import Error
+
+GRAPH_VERSION = 2
+# magic, version, vocabulary hash, number of terms, number of edges, hash of
+# the arrays
+_HEADER = struct.Struct('<8sI32sQQ32s')
+_MAGIC = b'FAWOCGRF'
+# number of terms processed by each task of build_graph
+GRAPH_CHUNK = 2000
+
+
+class InvalidGraphError(Error):
+    pass
+
+
+def vocabulary_hash(terms):
+    """
+    Computes the hash that identifies a vocabulary
+
+    The hash depends only on the index and the string of the terms, so it
+    does not change when the terms are classified.
+
+    :param terms: the terms
+    :type terms: Iterable[Term]
+    :return: the hash
+    :rtype: bytes
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    for t in sorted(terms, key=lambda t: t.index):
+        digest.update(f'{t.index}\t{t.string}\n'.encode('utf-8'))
+
+    return digest.digest()
+
+
+def graph_file(tsvfile):
+    """
+    Gives the path of the containment graph of tsvfile
+
+    :param tsvfile: path to the tsv file loaded by fawoc
+    :type tsvfile: str or Path
+    :return: the path of the graph file
+    :rtype: Path
+    """
+    file = Path(tsvfile).resolve()
+    return file.parent / '_'.join([file.stem, 'fawoc_graph.bin'])
+
+
+class ContainmentGraph:
+    """
+    The terms that contain each term of a vocabulary
+
+    For each term, the graph gives the other terms that contain it between
+    word boundaries (see TermList.is_related). The terms are identified by
+    their index. The adjacency lists are stored in two arrays, as in a
+    compressed sparse row matrix: the terms containing the term in position r
+    of ids are in targets[offsets[r]:offsets[r + 1]], as positions in ids.
+
+    :type vocab_hash: bytes
+    :type ids: array
+    :type offsets: array
+    :type targets: array
+    """
+
+    def __init__(self, vocab_hash, ids, offsets, targets):
+        """
+        :param vocab_hash: hash of the vocabulary (see vocabulary_hash)
+        :type vocab_hash: bytes
+        :param ids: indexes of the terms, sorted
+        :type ids: array
+        :param offsets: begin of the adjacency list of each term
+        :type offsets: array
+        :param targets: the adjacency lists
+        :type targets: array
+        """
+        self.vocab_hash = vocab_hash
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def containing(self, index):
+        """
+        Gives the terms that contain a term
+
+        :param index: index of the term
+        :type index: int
+        :return: the indexes of the terms that contain it, or None if the term
+            is not in the graph
+        :rtype: list[int] or None
+        """
+        r = bisect.bisect_left(self.ids, index)
+        if r == len(self.ids) or self.ids[r] != index:
+            return None
+
+        ids = self.ids
+        return [ids[p]
+                for p in self.targets[self.offsets[r]:self.offsets[r + 1]]]
+
+    def save(self, path):
+        """
+        Writes the graph to a file
+
+        The header holds a hash of the arrays, so load can detect a damaged
+        file.
+
+        :param path: path of the file
+        :type path: str or Path
+        """
+        path = Path(path)
+        arrays = [self.ids, self.offsets, self.targets]
+        if sys.byteorder == 'big':
+            arrays = [array(a.typecode, a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+
+        digest = hashlib.blake2b(digest_size=32)
+        for a in arrays:
+            digest.update(a)
+
+        with tempfile.NamedTemporaryFile('wb', dir=str(path.parent),
+                                         prefix='.fawoc.temp.',
+                                         delete=False) as out:
+            out.write(_HEADER.pack(_MAGIC, GRAPH_VERSION, self.vocab_hash,
+                                   len(self.ids), len(self.targets),
+                                   digest.digest()))
+            for a in arrays:
+                a.tofile(out)
+
+            temp = Path(out.name)
+
+        temp.replace(path)
+
+    @staticmethod
+    def load(path):
+        """
+        Reads a graph written by save
+
+        The arrays are checked against the hash in the header, and the
+        adjacency lists are checked to be within the arrays, so a damaged file
+        is refused here instead of failing when the graph is used.
+
+        :param path: path of the file
+        :type path: str or Path
+        :return: the graph
+        :rtype: ContainmentGraph
+        :raise InvalidGraphError: if the file is not a valid graph
+        """
+        with open(path, 'rb') as file:
+            header = file.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise InvalidGraphError('truncated header')
+
+            magic, version, vocab_hash, n, m, digest = _HEADER.unpack(header)
+            if magic != _MAGIC or version != GRAPH_VERSION:
+                raise InvalidGraphError('not a graph file of this version')
+
+            ids = array('q')
+            offsets = array('Q')
+            targets = array('I')
+            try:
+                ids.fromfile(file, n)
+                offsets.fromfile(file, n + 1)
+                targets.fromfile(file, m)
+            except EOFError:
+                raise InvalidGraphError('truncated file')
+
+            if len(file.read(1)) != 0:
+                raise InvalidGraphError('data after the graph')
+
+        arrays_hash = hashlib.blake2b(digest_size=32)
+        for a in (ids, offsets, targets):
+            arrays_hash.update(a)
+
+        if arrays_hash.digest() != digest:
+            raise InvalidGraphError('wrong hash')
+
+        if sys.byteorder == 'big':
+            for a in (ids, offsets, targets):
+                a.byteswap()
+
+        if any(a >= b for a, b in zip(ids, ids[1:])):
+            raise InvalidGraphError('the terms are not sorted')
+
+        if (offsets[0] != 0 or offsets[-1] != m
+                or any(a > b for a, b in zip(offsets, offsets[1:]))):
+            raise InvalidGraphError('invalid offsets')
+
+        if m > 0 and max(targets) >= n:
+            raise InvalidGraphError('invalid targets')
+
+        return ContainmentGraph(vocab_hash, ids, offsets, targets)
+
+
+def load_graph(tsvfile, terms):
+    """
+    Loads the containment graph of tsvfile, if it is the graph of terms
+
+    :param tsvfile: path to the tsv file loaded by fawoc
+    :type tsvfile: str or Path
+    :param terms: the terms loaded from tsvfile
+    :type terms: TermList
+    :return: the graph, or None if it is missing or it was built for another
+        vocabulary
+    :rtype: ContainmentGraph or None
+    :raise InvalidGraphError: if the graph file is not valid
+    """
+    try:
+        graph = ContainmentGraph.load(graph_file(tsvfile))
+    except FileNotFoundError:
+        return None
+
+    if graph.vocab_hash != vocabulary_hash(terms.items):
+        return None
+
+    return graph
+
+
+# the vocabulary of the worker processes of build_graph
+_strings = None
+_simple = None
+_postings = None
+
+
+def _init_worker(strings):
+    """
+    Sets the vocabulary of a worker process and builds its token index
+
+    :param strings: the strings of the terms, sorted by index
+    :type strings: list[str]
+    """
+    global _strings, _simple, _postings
+    _strings = strings
+    _simple = [_is_simple(s) for s in strings]
+    _postings = {}
+    for pos, s in enumerate(strings):
+        for tok in set(s.split()):
+            _postings.setdefault(tok, set()).add(pos)
+
+
+def _is_simple(string):
+    """
+    Tells if the words of string are separated by single spaces
+
+    :param string: the string
+    :type string: str
+    :return: True if string is made of words separated by single spaces
+    :rtype: bool
+    """
+    return string == ' '.join(string.split())
+
+
+def _containing_rows(start, stop):
+    """
+    Finds the terms that contain the terms in a range of positions
+
+    The candidates are the terms with all the tokens of the term. If both the
+    strings have their words separated by single spaces, the containment is
+    checked with the in operator, otherwise with the word matcher.
+
+    :param start: first position
+    :type start: int
+    :param stop: position after the last one
+    :type stop: int
+    :return: start and the positions of the terms that contain each term
+    :rtype: (int, list[array])
+    """
+    rows = []
+    for r in range(start, stop):
+        key = _strings[r]
+        tokens = set(key.split())
+        found = array('I')
+        if len(tokens) == 0:
+            # without tokens the related terms are searched at runtime
+            rows.append(found)
+            continue
+
+        postings = sorted((_postings[tok] for tok in tokens), key=len)
+        candidates = postings[0]
+        for p in postings[1:]:
+            # the intersection iterates over the smaller set
+            candidates = candidates & p
+
+        simple = _simple[r]
+        padded = f' {key} '
+        matcher = None
+        for c in sorted(candidates):
+            if c == r:
+                continue
+
+            s = _strings[c]
+            if simple and _simple[c]:
+                if padded in f' {s} ':
+                    found.append(c)
+                continue
+
+            if matcher is None:
+                matcher = utils.WordMatcher(key)
+            if matcher.search(s):
+                found.append(c)
+
+        rows.append(found)
+
+    return start, rows
+
+
+def build_graph(terms, jobs=None):
+    """
+    Computes the containment graph of a vocabulary
+
+    The terms are split in chunks of GRAPH_CHUNK terms, that are processed in
+    parallel by a pool of processes.
+
+    :param terms: the terms
+    :type terms: TermList
+    :param jobs: number of processes. Default: None (as many as the cpus)
+    :type jobs: int or None
+    :return: the graph
+    :rtype: ContainmentGraph
+    """
+    items = sorted(terms.items, key=lambda t: t.index)
+    ids = array('q', (t.index for t in items))
+    strings = [t.string for t in items]
+    chunks = [(start, min(start + GRAPH_CHUNK, len(strings)))
+              for start in range(0, len(strings), GRAPH_CHUNK)]
+    results = [None] * len(chunks)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max(1, min(jobs, len(chunks))),
+            initializer=_init_worker, initargs=(strings, )) as pool:
+        futures = [pool.submit(_containing_rows, start, stop)
+                   for start, stop in chunks]
+        for fut in concurrent.futures.as_completed(futures):
+            start, rows = fut.result()
+            results[start // GRAPH_CHUNK] = rows
+
+    offsets = array('Q', [0])
+    targets = array('I')
+    for rows in results:
+        for found in rows:
+            targets.extend(found)
+            offsets.append(len(targets))
+
+    return ContainmentGraph(vocabulary_hash(items), ids, offsets, targets)
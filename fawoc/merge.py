@@ -0,0 +1,197 @@
+import concurrent.futures
+import csv
+import pathlib
+import tempfile
+
+import utils
+from terms import Error, InvalidTsvError, Label, TermList
+
+
+class MergeError(Error):
+    pass
+
+
+def load_labels(datafile):
+    """
+    Loads the labels of an annotated copy of a datafile
+
+    The labels are read as TermList.from_tsv reads them (the delta file is
+    applied to the tsv file), but the copy is read one row at a time and only
+    the ids and the classified terms are kept, so the memory used is small
+    even if the whole vocabulary is big. The service data is not read, since
+    it holds no label.
+    It is run in a worker process by merge.
+
+    :param datafile: path of the tsv file of the copy
+    :type datafile: str
+    :return: the name of the label of each classified term, by id and string
+    :rtype: dict[tuple[int, str], str]
+    :raise InvalidTsvError: if two rows have the same id
+    """
+    delta, _ = TermList.read_tsv_delta(pathlib.Path(datafile).resolve())
+    labels = {}
+    ids = set()
+    with utils.TsvColumnReader(datafile,
+                               ['id', 'term', 'keyword', 'label']) as reader:
+        columns = set(reader.fieldnames or [])
+        if 'term' not in columns and 'keyword' not in columns:
+            raise KeyError('keyword')
+
+        for i, (id_value, term, keyword, lbl_name) in enumerate(reader):
+            if 'id' in columns:
+                idx = int(id_value)
+                if idx in ids:
+                    raise InvalidTsvError(f'id {idx} is repeated')
+
+                ids.add(idx)
+            else:
+                idx = i
+
+            if 'term' not in columns:
+                term = keyword
+
+            label = delta.get(idx)
+            if label is None:
+                if 'label' not in columns:
+                    continue
+
+                label = Label.get_from_name(lbl_name)
+
+            if label != Label.labels['NONE']:
+                labels[(idx, term)] = label[0]
+
+    return labels
+
+
+def resolve(labels):
+    """
+    Chooses the merged label of a term among the labels of the copies
+
+    The copies where the term is not classified are ignored. A postponed term
+    takes the label given by another copy. The term has no label if the
+    copies give different labels.
+
+    :param labels: the names of the labels given by the copies
+    :type labels: Iterable[str]
+    :return: the name of the merged label and True if the labels conflict
+    :rtype: (str, bool)
+    """
+    given = set(labels)
+    given.discard('')
+    if len(given) > 1:
+        given.discard(Label.labels['POSTPONED'][0])
+
+    if len(given) == 0:
+        return '', False
+    elif len(given) == 1:
+        return given.pop(), False
+    else:
+        return '', True
+
+
+def merge(datafiles, outfile, report, jobs=None):
+    """
+    Merges the labels of several annotated copies of the same datafile
+
+    The copies are loaded in parallel by a pool of processes, that read them
+    one row at a time and give only their classified terms (see
+    load_labels). The terms are joined on their id and string with
+    a hash table. Then the first copy is read one row at a time, and each row
+    is written in outfile with its merged label (see resolve). The terms
+    labelled differently by the copies are written in report, with the label
+    given by each copy.
+    No copy is held in memory in whole: only the classified terms of the
+    copies are kept, and outfile and report are written while the first copy
+    is read.
+
+    :param datafiles: paths of the tsv files of the copies
+    :type datafiles: list[str]
+    :param outfile: path of the merged tsv file
+    :type outfile: str
+    :param report: path of the tsv file with the conflicts
+    :type report: str
+    :param jobs: number of processes. Default: None (as many as the cpus)
+    :type jobs: int or None
+    :return: the number of terms merged, of the conflicts, and of the
+        classified terms that are not in the first copy
+    :rtype: (int, int, int)
+    :raise MergeError: if the output files are also inputs
+    """
+    out_path = pathlib.Path(outfile).resolve()
+    report_path = pathlib.Path(report).resolve()
+    paths = [pathlib.Path(d).resolve() for d in datafiles]
+    if out_path in paths or report_path in paths:
+        raise MergeError('the output files must not be one of the copies')
+
+    if out_path == report_path:
+        raise MergeError('the merged file and the report must be different')
+
+    # (id, term) -> label given by each copy
+    votes = {}
+    n_copies = len(datafiles)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(load_labels, d): i
+                   for i, d in enumerate(datafiles)}
+        # the copies are joined as soon as they are loaded, and each result
+        # is dropped after the join
+        for fut in concurrent.futures.as_completed(futures):
+            i = futures.pop(fut)
+            result = fut.result()
+            del fut
+            for key, label in result.items():
+                labels = votes.get(key)
+                if labels is None:
+                    labels = [''] * n_copies
+                    votes[key] = labels
+
+                labels[i] = label
+
+            del result
+
+    merged = 0
+    conflicts = 0
+    with utils.TsvColumnReader(datafiles[0],
+                               ['id', 'term', 'keyword']) as reader:
+        columns = set(reader.fieldnames or [])
+        if 'term' not in columns and 'keyword' not in columns:
+            raise KeyError('keyword')
+
+        with tempfile.NamedTemporaryFile('w', dir=str(out_path.parent),
+                                         prefix='.fawoc.temp.',
+                                         encoding='utf-8', delete=False,
+                                         newline='') as out:
+            temp = pathlib.Path(out.name)
+            try:
+                with open(report_path, 'w', encoding='utf-8',
+                          newline='') as rep:
+                    writer = csv.writer(out, delimiter='\t', quotechar='"',
+                                        quoting=csv.QUOTE_MINIMAL)
+                    writer.writerow(['id', 'term', 'label'])
+                    rep_writer = csv.writer(rep, delimiter='\t',
+                                            quotechar='"',
+                                            quoting=csv.QUOTE_MINIMAL)
+                    rep_writer.writerow(['id', 'term'] + list(datafiles))
+                    for i, (id_value, term, keyword) in enumerate(reader):
+                        idx = int(id_value) if 'id' in columns else i
+                        if 'term' not in columns:
+                            term = keyword
+
+                        labels = votes.pop((idx, term), None)
+                        if labels is None:
+                            label = ''
+                        else:
+                            label, conflict = resolve(labels)
+                            if conflict:
+                                rep_writer.writerow([idx, term] + labels)
+                                conflicts += 1
+
+                        writer.writerow([idx, term, label])
+                        merged += 1
+            except BaseException:
+                # the merged file is not complete: remove it
+                out.close()
+                temp.unlink()
+                raise
+
+    temp.replace(out_path)
+    return merged, conflicts, len(votes)
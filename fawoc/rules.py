@@ -0,0 +1,207 @@
+import json
+import re
+
+from terms import Error, Label
+
+
+class InvalidRulesError(Error):
+    pass
+
+
+# fields of a rule and the type of their value
+RULE_FIELDS = {
+    'label': str,
+    'tokens': list,
+    'regex': str,
+    'min_ngram': int,
+    'max_ngram': int,
+    'min_count': int,
+    'max_count': int,
+}
+
+
+class Rule:
+    """
+    A rule that assigns a label to the terms that match it
+
+    A term matches the rule if it satisfies all the conditions set in the rule:
+    * tokens: the term contains at least one of these tokens;
+    * regex: the regular expression matches somewhere in the term;
+    * min_ngram/max_ngram: bounds (included) of the number of tokens of the
+      term;
+    * min_count/max_count: bounds (included) of the count of the term.
+
+    A rule has at least one condition. The count conditions need the count
+    of the terms (see apply_rules).
+
+    :type label: Label
+    :type tokens: frozenset[str] or None
+    :type regex: re.Pattern or None
+    """
+
+    def __init__(self, label, tokens=None, regex=None, min_ngram=None,
+                 max_ngram=None, min_count=None, max_count=None):
+        self.label = label
+        self.tokens = None if tokens is None else frozenset(tokens)
+        self.regex = None if regex is None else re.compile(regex)
+        self.min_ngram = min_ngram
+        self.max_ngram = max_ngram
+        self.min_count = min_count
+        self.max_count = max_count
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Creates a Rule from its json representation
+
+        :param data: the rule as loaded from json
+        :type data: dict
+        :return: the rule
+        :rtype: Rule
+        :raise InvalidRulesError: if data is not a valid rule
+        """
+        if not isinstance(data, dict):
+            raise InvalidRulesError(f'rule {data!r} is not a dict')
+
+        for field, value in data.items():
+            if field not in RULE_FIELDS:
+                raise InvalidRulesError(f'unknown field {field!r}')
+
+            if (not isinstance(value, RULE_FIELDS[field])
+                    or isinstance(value, bool)):
+                typ = RULE_FIELDS[field].__name__
+                raise InvalidRulesError(f'field {field!r} is not a {typ}')
+
+        if 'label' not in data:
+            raise InvalidRulesError(f'missing label in rule {data!r}')
+
+        if len(data) == 1:
+            # a rule without conditions would label all the terms
+            raise InvalidRulesError(f'no condition in rule {data!r}')
+
+        try:
+            label = Label.get_from_name(data['label'])
+        except ValueError:
+            raise InvalidRulesError(f'{data["label"]!r} is not a valid label')
+
+        if label == Label.labels['NONE']:
+            raise InvalidRulesError('the empty label is not valid')
+
+        tokens = data.get('tokens')
+        if tokens is not None and not all(isinstance(t, str) for t in tokens):
+            raise InvalidRulesError('field \'tokens\' is not a list of str')
+
+        try:
+            return Rule(label, tokens, data.get('regex'),
+                        data.get('min_ngram'), data.get('max_ngram'),
+                        data.get('min_count'), data.get('max_count'))
+        except re.error as err:
+            raise InvalidRulesError(f'invalid regex {data["regex"]!r}: {err}')
+
+    def match(self, term, tokens):
+        """
+        Tells if a term matches the rule
+
+        The cheapest conditions are checked first.
+
+        :param term: the term
+        :type term: Term
+        :param tokens: the tokens of the term
+        :type tokens: list[str]
+        :return: True if the term matches the rule
+        :rtype: bool
+        """
+        if self.min_ngram is not None and len(tokens) < self.min_ngram:
+            return False
+        if self.max_ngram is not None and len(tokens) > self.max_ngram:
+            return False
+        if self.min_count is not None and term.count < self.min_count:
+            return False
+        if self.max_count is not None and term.count > self.max_count:
+            return False
+        if self.tokens is not None and self.tokens.isdisjoint(tokens):
+            return False
+        if self.regex is not None and self.regex.search(term.string) is None:
+            return False
+
+        return True
+
+    def uses_count(self):
+        """
+        Tells if the rule has a condition on the count of the terms
+
+        :return: True if min_count or max_count is set
+        :rtype: bool
+        """
+        return self.min_count is not None or self.max_count is not None
+
+
+def load_rules(path):
+    """
+    Loads the rules from a json file
+
+    The file contains a list of rules. Each rule is a dict with the 'label' to
+    assign and the conditions of the rule (see Rule).
+
+    :param path: path of the rule file
+    :type path: str or pathlib.Path
+    :return: the rules, in the order of the file
+    :rtype: list[Rule]
+    :raise InvalidRulesError: if the rules are not valid
+    """
+    with open(path, encoding='utf-8') as file:
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError as err:
+            raise InvalidRulesError(f'invalid json: {err}')
+
+    if not isinstance(data, list):
+        raise InvalidRulesError('the rules are not a list')
+
+    return [Rule.from_dict(d) for d in data]
+
+
+def apply_rules(terms, rules):
+    """
+    Labels the terms not classified that match a rule
+
+    The terms are checked in a single pass, in order of index. Each term gets
+    the label of the first rule that it matches, and a classification order
+    after the one of the last classified term.
+    The count of a term is -1 if it is unknown: the rules with a condition on
+    the count are refused if a term to check has no count, and no term is
+    labelled.
+
+    :param terms: the terms
+    :type terms: TermList
+    :param rules: the rules
+    :type rules: list[Rule]
+    :return: the number of terms labelled with each label
+    :rtype: dict[Label, int]
+    :raise InvalidRulesError: if a rule has a condition on the count and the
+        count of a term is unknown
+    """
+    candidates = sorted(terms.get_not_classified(), key=lambda t: t.index)
+    if any(rule.uses_count() for rule in rules):
+        missing = sum(1 for t in candidates if t.count < 0)
+        if missing > 0:
+            raise InvalidRulesError(f'the count of {missing} terms is unknown:'
+                                    ' min_count and max_count cannot be used')
+
+    matches = []
+    for t in candidates:
+        tokens = t.string.split()
+        for rule in rules:
+            if rule.match(t, tokens):
+                matches.append((t, rule.label))
+                break
+
+    order = terms.get_last_classified_order()
+    counts = {}
+    for t, label in matches:
+        order += 1
+        # the Term itself is classified: its string can be repeated
+        terms.classify_item(t, label, order)
+        counts[label] = counts.get(label, 0) + 1
+
+    return counts
@@ -0,0 +1,543 @@
+import json
+import sqlite3
+from pathlib import Path
+
+import utils
+from terms import InvalidTsvError, Label, SaveJob, TermList, TermStore
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL,
+    label TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    related TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS terms_label_ord ON terms (label, ord);
+CREATE INDEX IF NOT EXISTS terms_ord ON terms (ord);
+CREATE VIRTUAL TABLE IF NOT EXISTS terms_fts USING fts5(
+    term, content='terms', content_rowid='id'
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+class SqliteTermList(TermList):
+    """
+    TermList stored in a SQLite database
+
+    The database is the path of the tsv file stripped by the extension, with
+    the suffix '_fawoc.sqlite'. It holds the terms with their label, order,
+    related term and count. The Terms are also kept in memory, so the Terms
+    given by the methods are always the same objects, but the searches by
+    label, by order and of the related terms are queries on the indexes of
+    the database. Each classification is written to the database at once, in
+    its own transaction.
+    The tsv file and the fawoc_data files are written only on the complete
+    saves, as with a TermList. The database records which files it was last
+    synchronized with: if they are changed by others, the database is
+    imported again from them (see open).
+
+    :type dbfile: str
+    """
+
+    def __init__(self, dbfile):
+        """
+        Creates an empty SqliteTermList
+
+        :param dbfile: path of the database. ':memory:' uses a database that
+            is never written to disk
+        :type dbfile: str or Path
+        """
+        super().__init__()
+        self.dbfile = str(dbfile)
+        # the list can be loaded in a thread and used in another
+        self._conn = sqlite3.connect(self.dbfile, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    @staticmethod
+    def db_file(tsvfile):
+        """
+        Gives the path of the database of tsvfile
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :return: the path of the database
+        :rtype: Path
+        """
+        file = Path(tsvfile).resolve()
+        return file.parent / '_'.join([file.stem, 'fawoc.sqlite'])
+
+    @classmethod
+    def open(cls, tsvfile, load_invariant=True, readonly=False):
+        """
+        Opens the database of tsvfile
+
+        The terms are loaded from the database if it was synchronized with the
+        current content of tsvfile, of its delta file and of its fawoc_data
+        files. Otherwise the terms are loaded from these files, as with
+        from_tsv, load_service_data and sort_by_order, and then they are
+        imported in the database.
+        If readonly is True, the database is copied in memory and the changes
+        are never written to disk.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :param load_invariant: if True (the default) the invariant data is
+            loaded into fawoc
+        :type load_invariant: bool
+        :param readonly: if True the database file is not changed.
+            Default: False
+        :type readonly: bool
+        :return: the terms
+        :rtype: SqliteTermList
+        :raise InvalidServiceDataError: if the service data are invalid
+        :raise InvalidTsvError: if two terms of tsvfile have the same id, as
+            with from_tsv
+        """
+        dbfile = cls.db_file(tsvfile)
+        if readonly:
+            terms = cls(':memory:')
+            if dbfile.exists():
+                source = sqlite3.connect(str(dbfile))
+                try:
+                    source.backup(terms._conn)
+                finally:
+                    source.close()
+        else:
+            terms = cls(dbfile)
+
+        _, sources = cls._cache_files(tsvfile)
+        key = json.dumps(cls._cache_key(sources, load_invariant))
+        if terms._get_meta('source') == key:
+            terms._load_db()
+        else:
+            terms.from_tsv(tsvfile)
+            terms.load_service_data(tsvfile, load_invariant=load_invariant)
+            terms.sort_by_order()
+            terms._import_items(key)
+
+        # the tsv file and the service data are always rewritten completely
+        terms._dirty_rows = None
+        terms._dirty_service = None
+        return terms
+
+    def _get_meta(self, key):
+        """
+        Reads a value from the meta table
+
+        :param key: the key of the value
+        :type key: str
+        :return: the value or None if the key is missing
+        :rtype: str or None
+        """
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?',
+                                 (key, )).fetchone()
+        if row is None:
+            return None
+
+        return row[0]
+
+    def _set_meta(self, key, value):
+        """
+        Writes a value in the meta table
+
+        Must be called inside a transaction.
+        :param key: the key of the value
+        :type key: str
+        :param value: the value
+        :type value: str
+        """
+        self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                           (key, value))
+
+    def _load_db(self):
+        """
+        Loads the terms from the database
+        """
+        labels = {}
+        store = TermStore()
+        items = []
+        related = []
+        query = '''SELECT id, term, label, ord, related, count FROM terms
+                   ORDER BY ord, id'''
+        for idx, term, lbl_name, order, rel, count in self._conn.execute(query):
+            label = labels.get(lbl_name)
+            if label is None:
+                label = labels[lbl_name] = Label.get_from_name(lbl_name)
+
+            row = store.add(idx, term, count, label, order, '')
+            if rel != '':
+                related.append((row, rel))
+
+            items.append(store.view(row))
+
+        # the related strings are set when all the strings are in the store
+        for row, rel in related:
+            store.set_related(row, rel)
+
+        self.items = items
+        self.csv_header = json.loads(self._get_meta('csv_header'))
+
+    def _import_items(self, source):
+        """
+        Replaces the content of the database with the terms in self
+
+        The id of the terms is the key of the table, so it must be unique, as
+        in a TermList.
+
+        :param source: the key of the files that the terms come from
+        :type source: str
+        :raise InvalidTsvError: if two terms have the same id
+        """
+        rows = ((t.index, t.string, t.label[0], t.order, t.related, t.count)
+                for t in self.items)
+        with self._conn:
+            self._conn.execute('DELETE FROM terms')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO terms VALUES (?, ?, ?, ?, ?, ?)', rows)
+            except sqlite3.IntegrityError as err:
+                raise InvalidTsvError(f'the ids are not unique: {err}')
+
+            self._conn.execute(
+                "INSERT INTO terms_fts(terms_fts) VALUES('rebuild')")
+            self._set_meta('csv_header', json.dumps(self.csv_header))
+            self._set_meta('source', source)
+
+    def build_postings(self):
+        """
+        Does nothing: the related terms are found with the full text index of
+        the database
+        """
+        pass
+
+    def _select(self, query, params=()):
+        """
+        Gives the Terms with the ids selected by query
+
+        :param query: a query that selects only the id of the terms
+        :type query: str
+        :param params: the parameters of the query
+        :type params: tuple
+        :return: the Terms in the order given by the query
+        :rtype: list[Term]
+        """
+        items = self._items
+        return [items[idx] for idx, in self._conn.execute(query, params)]
+
+    def save_cache(self, tsvfile, save_invariant=True):
+        """
+        Records that the database is synchronized with the files of tsvfile
+
+        It must be called right after a complete save with to_tsv and
+        save_service_data, like TermList.save_cache.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :param save_invariant: if the invariant data was saved by
+            save_service_data. Default: True
+        :type save_invariant: bool
+        """
+        _, sources = self._cache_files(tsvfile)
+        key = json.dumps(self._cache_key(sources, save_invariant))
+        with self._conn:
+            self._set_meta('csv_header', json.dumps(self.csv_header))
+            self._set_meta('source', key)
+
+    def tsv_job(self, outfile, incremental=False):
+        """
+        Prepares the save of the terms in a tsv file
+
+        The incremental saves have nothing to write, since the changes are
+        already in the database. See TermList.tsv_job.
+
+        :param outfile: path to the tsv file to write the terms
+        :type outfile: str
+        :param incremental: if True only the changed terms are saved.
+            Default: False
+        :type incremental: bool
+        :return: the job that saves the terms
+        :rtype: SaveJob
+        """
+        if incremental:
+            return SaveJob(Path(outfile).resolve(), False, self._write_nothing,
+                           (self.dbfile, []))
+
+        return super().tsv_job(outfile)
+
+    def service_data_job(self, tsvfile, save_invariant=True, compact=True):
+        """
+        Prepares the save of the service data of fawoc
+
+        The saves that are not compact have nothing to write, since the
+        changes are already in the database. See TermList.service_data_job.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :param save_invariant: if True (the default) the invariant data is saved
+        :type save_invariant: bool
+        :param compact: if True (the default) the json file is rewritten
+        :type compact: bool
+        :return: the job that saves the service data
+        :rtype: SaveJob
+        """
+        if not compact:
+            return SaveJob(Path(tsvfile).resolve(), False, self._write_nothing,
+                           (self.dbfile, []))
+
+        return super().service_data_job(tsvfile, save_invariant=save_invariant)
+
+    @staticmethod
+    def _write_nothing(data):
+        """
+        Writer of the jobs that have nothing to save
+
+        :param data: the path of the database and an empty list
+        :type data: (str, list)
+        """
+        pass
+
+    def classify_item(self, item, label, order, related=''):
+        """
+        Classifies a Term and writes it to the database
+
+        See TermList.classify_item. classify_term uses this method, so also
+        the terms classified by string are written.
+
+        :param item: the Term to classify
+        :type item: Term
+        :param label: the Label to be assigned to the term
+        :type label: Label
+        :param order: the classification order
+        :type order: int
+        :param related: related term (if any). Default: ''
+        :type related: str
+        :return: self
+        :rtype: SqliteTermList
+        """
+        super().classify_item(item, label, order, related=related)
+        with self._conn:
+            self._conn.execute('''UPDATE terms SET label = ?, ord = ?,
+                                  related = ? WHERE id = ?''',
+                               (label[0], order, related, item.index))
+
+        return self
+
+    def classify_terms(self, terms, label, order, related=''):
+        """
+        Classifies many terms and writes them to the database
+
+        See TermList.classify_terms. The terms are written in a single
+        transaction.
+
+        :param terms: the terms to classify
+        :type terms: list[str]
+        :param label: the Label to be assigned to the terms
+        :type label: Label
+        :param order: the classification order of the first term
+        :type order: int
+        :param related: related term (if any). Default: ''
+        :type related: str
+        :return: self
+        :rtype: SqliteTermList
+        """
+        super().classify_terms(terms, label, order, related=related)
+        rows = []
+        for i, term in enumerate(terms):
+            w = self.get(term)
+            if w is not None:
+                rows.append((label[0], order + i if order >= 0 else -1,
+                             related, w.index))
+
+        with self._conn:
+            self._conn.executemany('''UPDATE terms SET label = ?, ord = ?,
+                                      related = ? WHERE id = ?''', rows)
+
+        return self
+
+    def classify_items(self, items, label, order, related=''):
+        """
+        Classifies many Terms and writes them to the database
+
+        See TermList.classify_items. The terms are written in a single
+        transaction.
+
+        :param items: the Terms to classify
+        :type items: list[Term]
+        :param label: the Label to be assigned to the terms
+        :type label: Label
+        :param order: the classification order of the first term
+        :type order: int
+        :param related: related term (if any). Default: ''
+        :type related: str
+        :return: self
+        :rtype: SqliteTermList
+        """
+        super().classify_items(items, label, order, related=related)
+        rows = [(label[0], order + i if order >= 0 else -1, related, w.index)
+                for i, w in enumerate(items)]
+        with self._conn:
+            self._conn.executemany('''UPDATE terms SET label = ?, ord = ?,
+                                      related = ? WHERE id = ?''', rows)
+
+        return self
+
+    def clear_order(self):
+        """
+        Resets the order and the related term of all the terms
+
+        See TermList.clear_order.
+        """
+        super().clear_order()
+        with self._conn:
+            self._conn.execute("UPDATE terms SET ord = -1, related = ''")
+
+    def get_from_label(self, label, order_set=None):
+        """
+        Gets a new TermList with all the Terms with the specified labels
+
+        See TermList.get_from_label. The Terms are sorted by order and index.
+
+        :param label: the label to search
+        :type label: Label or list[Label] or tuple[Label]
+        :param order_set: also filters by order
+        :type order_set: bool or None
+        :return: a TermList containing the Terms classified with the labels
+        :rtype: TermList
+        """
+        if isinstance(label, tuple):
+            label = [label]
+        elif not isinstance(label, (list, tuple)):
+            raise TypeError('label has wrong type {}'.format(type(label)))
+
+        names = [lbl[0] for lbl in label]
+        query = 'SELECT id FROM terms WHERE label IN ({})'.format(
+            ', '.join('?' * len(names)))
+        if order_set is not None:
+            query += ' AND ord >= 0' if order_set else ' AND ord < 0'
+
+        query += ' ORDER BY ord, id'
+        return TermList(self._select(query, tuple(names)))
+
+    def get_not_classified(self):
+        """
+        Gets a new TermList with all the Terms not classified
+
+        :return: a TermList containing the Terms not classified
+        :rtype: TermList
+        """
+        query = "SELECT id FROM terms WHERE label = '' ORDER BY ord, id"
+        return TermList(self._select(query))
+
+    def get_classified(self):
+        """
+        Gets a new TermList with all the Terms already classified
+
+        :return: a TermList containing the Terms classified
+        :rtype: TermList
+        """
+        query = "SELECT id FROM terms WHERE label != '' ORDER BY ord, id"
+        return TermList(self._select(query))
+
+    def get_last_classified_order(self):
+        """
+        Finds the classification order of the last classified term
+
+        :return: the classification order of the last classified term
+        :rtype: int
+        """
+        order, = self._conn.execute('SELECT MAX(ord) FROM terms').fetchone()
+        if order is None or order < 0:
+            return -1
+
+        return order
+
+    def get_last_classified_term(self):
+        """
+        Finds the last classified term
+
+        :return: the last classified term
+        :rtype: Term or None
+        """
+        query = '''SELECT id FROM terms WHERE ord >= 0
+                   ORDER BY ord DESC, id LIMIT 1'''
+        items = self._select(query)
+        if len(items) == 0:
+            return None
+
+        return items[0]
+
+    def get_related_items(self, key, label=Label.labels['NONE']):
+        """
+        Gets a new TermList with the items in self related to key
+
+        See TermList.get_related_items. Without a containment graph, the
+        candidates are the terms that contain all the tokens of key, found
+        with the full text index.
+
+        :param key: the substring to find in the terms in self.items
+        :type key: str
+        :param label: label to consider
+        :type label: Label
+        :return: the terms related to key
+        :rtype: TermList
+        """
+        containing = self._graph_related(key)
+        if containing is not None:
+            containing = [w for w in containing
+                          if w.label == label and w.order < 0]
+            containing.sort(key=lambda t: t.index)
+            return TermList(containing)
+
+        # a token without letters or digits is not indexed
+        phrases = ['"{}"'.format(tok.replace('"', '""'))
+                   for tok in set(key.split())
+                   if any(c.isalnum() for c in tok)]
+        query = '''SELECT terms.id FROM terms_fts
+                   JOIN terms ON terms.id = terms_fts.rowid
+                   WHERE terms_fts MATCH ? AND label = ? AND ord < 0
+                   ORDER BY terms.id'''
+        candidates = None
+        if len(phrases) > 0:
+            try:
+                candidates = self._select(query,
+                                          (' AND '.join(phrases), label[0]))
+            except sqlite3.OperationalError:
+                candidates = None
+
+        if candidates is None:
+            # no usable token in key: fallback to the full scan
+            query = '''SELECT id FROM terms WHERE label = ? AND ord < 0
+                       ORDER BY id'''
+            candidates = self._select(query, (label[0], ))
+
+        matcher = utils.word_matcher(key)
+        found = matcher.search_all([w.string for w in candidates])
+        return TermList([candidates[i] for i in found])
+
+    def return_related_items(self, key, label=Label.labels['NONE']):
+        """
+        Searches related items in self and returns the resulting partition
+
+        See TermList.return_related_items.
+
+        :param key: the substring to find in the terms in self.items
+        :type key: str
+        :param label: label to consider
+        :type label: Label
+        :return: the partition of the items in self based on key
+        :rtype: (TermList, TermList)
+        """
+        co = self.get_related_items(key, label=label)
+        related = {w.index for w in co.items}
+        query = 'SELECT id FROM terms WHERE label = ? AND ord < 0 ORDER BY id'
+        not_containing = [w for w in self._select(query, (label[0], ))
+                          if w.index not in related]
+        return co, TermList(not_containing)
@@ -1,10 +1,19 @@
+import bisect
+import collections
 import csv
+import hashlib
+import io
+import itertools
 import json
+import os
 import pathlib
+import struct
+import sys
 import tempfile
 import logging
+import threading
 import time
-from dataclasses import dataclass
+from array import array
 from pathlib import Path
 
 import utils
@@ -19,8 +28,23 @@ class Error(Exception):
 class InvalidServiceDataError(Error):
     pass
 
-debug_logger = utils.setup_logger('debug_logger', 'slr-kit.log',
-        level=logging.DEBUG)
+
+class InvalidTsvError(Error):
+    pass
+
+# the handler of the log is attached by the application (see fawoc_run)
+debug_logger = logging.getLogger('debug_logger')
+
+# number of journal entries that triggers the rewrite of the json service file
+JOURNAL_COMPACT_THRESHOLD = 10000
+# version of the format of the snapshot cache
+CACHE_VERSION = 5
+# magic, version, length of the key and of the data, and hash of the content
+# of the snapshot cache
+_CACHE_HEADER = struct.Struct('<8sIQQ32s')
+_CACHE_MAGIC = b'FAWOCCHE'
+# columns of the tsv file read by TermList.from_tsv
+TSV_COLUMNS = ['id', 'term', 'keyword', 'label', 'order', 'related', 'count']
 
 
 class LabelClass():
@@ -101,14 +125,314 @@ class LabelClass():
 Label = LabelClass()
 
 
-@dataclass
+class TermStore:
+    """
+    Columnar storage of the data of the Terms
+
+    Each Term is a row of the store. The integer fields are kept in arrays,
+    the label as a small integer code and the related string as the row of
+    the Term with that string. The strings of the Terms are kept in a single
+    table, that is also used for the related strings.
+    A related string that is not the string of any Term in the store is kept
+    apart, with the code RELATED_OTHER.
+    The number of tokens of each string is computed once, when the string is
+    set, and kept in the ntokens column.
+
+    :type strings: list[str]
+    """
+    # related codes that are not a row
+    RELATED_NONE = -1
+    RELATED_OTHER = -2
+    # maximum value of the ntokens column
+    MAX_NTOKENS = 0xffff
+
+    def __init__(self):
+        """
+        Creates an empty TermStore
+        """
+        self.index = array('q')
+        self.count = array('q')
+        self.order = array('q')
+        self.label = array('B')
+        self.related = array('q')
+        self.ntokens = array('H')
+        self.strings = []
+        self._other_related = {}
+        self._rows = None
+        # the table of the label codes, that can grow with new labels
+        self._label_table = list(Label.labels.values())
+        self._label_codes = {lbl: i for i, lbl in enumerate(self._label_table)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def label_code(self, label):
+        """
+        Gives the code of label
+
+        :param label: the label to encode
+        :type label: Label
+        :return: the code of the label
+        :rtype: int
+        """
+        try:
+            return self._label_codes[label]
+        except KeyError:
+            self._label_codes[label] = len(self._label_table)
+            self._label_table.append(label)
+            return self._label_codes[label]
+
+    def label_from_code(self, code):
+        """
+        Gives the label with the specified code
+
+        :param code: the code of the label
+        :type code: int
+        :return: the label
+        :rtype: Label
+        """
+        return self._label_table[code]
+
+    def _string_rows(self):
+        """
+        Gives the row of each string
+
+        The index is built on first use and then kept in sync with self.
+
+        :return: the dict that maps each string to the first row with it
+        :rtype: dict[str, int]
+        """
+        if self._rows is None:
+            self._rows = {}
+            for row, string in enumerate(self.strings):
+                self._rows.setdefault(string, row)
+
+        return self._rows
+
+    def add(self, index, string, count, label, order, related):
+        """
+        Adds a row to self
+
+        :param index: index of the Term
+        :type index: int
+        :param string: string of the Term
+        :type string: str
+        :param count: count of the Term
+        :type count: int
+        :param label: label of the Term
+        :type label: Label
+        :param order: classification order of the Term
+        :type order: int
+        :param related: related string of the Term
+        :type related: str
+        :return: the new row
+        :rtype: int
+        """
+        row = len(self.strings)
+        self.index.append(index)
+        self.count.append(count)
+        self.order.append(order)
+        self.label.append(self.label_code(label))
+        self.related.append(self.RELATED_NONE)
+        self.ntokens.append(self.count_tokens(string))
+        self.strings.append(string)
+        if self._rows is not None:
+            self._rows.setdefault(string, row)
+
+        if related != '':
+            self.set_related(row, related)
+
+        return row
+
+    def count_tokens(self, string):
+        """
+        Counts the tokens (as given by str.split) of string
+
+        :param string: the string
+        :type string: str
+        :return: the number of tokens, at most MAX_NTOKENS
+        :rtype: int
+        """
+        return min(len(string.split()), self.MAX_NTOKENS)
+
+    def get_related(self, row):
+        """
+        Gives the related string of row
+
+        :param row: the row
+        :type row: int
+        :return: the related string
+        :rtype: str
+        """
+        code = self.related[row]
+        if code >= 0:
+            return self.strings[code]
+        elif code == self.RELATED_NONE:
+            return ''
+        else:
+            return self._other_related[row]
+
+    def set_related(self, row, related):
+        """
+        Sets the related string of row
+
+        :param row: the row
+        :type row: int
+        :param related: the related string
+        :type related: str
+        """
+        self._other_related.pop(row, None)
+        if related == '':
+            self.related[row] = self.RELATED_NONE
+            return
+
+        code = self._string_rows().get(related)
+        if code is None:
+            code = self.RELATED_OTHER
+            self._other_related[row] = related
+
+        self.related[row] = code
+
+    def view(self, row):
+        """
+        Gives the Term of row
+
+        :param row: the row
+        :type row: int
+        :return: a Term that reads and writes row
+        :rtype: Term
+        """
+        term = Term.__new__(Term)
+        term._store = self
+        term._row = row
+        return term
+
+
 class Term:
-    index: int
-    string: str
-    count: int
-    label: Label
-    order: int
-    related: str
+    """
+    A term to classify
+
+    A Term is a view of a row of a TermStore. The Terms loaded by a TermList
+    share one store, while a Term created by itself gets a new store with
+    only its row.
+    Two Terms are equal if they are views of the same row of the same store,
+    and not if their fields are equal: a Term is equal only to the other views
+    of its row. So the same term read twice from a file gives two different
+    Terms, that must be matched by index or by string. The hash of a Term
+    does not change when its fields are changed.
+
+    :type index: int
+    :type string: str
+    :type count: int
+    :type label: Label
+    :type order: int
+    :type related: str
+    """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, index, string, count, label, order, related,
+                 store=None):
+        """
+        Creates a Term adding a row to store
+
+        A TermStore is allocated for each Term created without a store: to
+        create many Terms, add their rows to one store with TermStore.add and
+        get the Terms with TermStore.view.
+
+        :param index: identification number of the term
+        :type index: int
+        :param string: the term
+        :type string: str
+        :param count: number of occurrences of the term, or -1 if unknown
+        :type count: int
+        :param label: the label of the term
+        :type label: Label
+        :param order: classification order, or -1 if the term has no order
+        :type order: int
+        :param related: related term active when the term was classified
+        :type related: str
+        :param store: the store of the Term. If None, a new TermStore is used
+        :type store: TermStore or None
+        """
+        if store is None:
+            store = TermStore()
+
+        self._store = store
+        self._row = store.add(index, string, count, label, order, related)
+
+    @property
+    def index(self):
+        return self._store.index[self._row]
+
+    @index.setter
+    def index(self, value):
+        self._store.index[self._row] = value
+
+    @property
+    def string(self):
+        return self._store.strings[self._row]
+
+    @string.setter
+    def string(self, value):
+        self._store.strings[self._row] = value
+        self._store.ntokens[self._row] = self._store.count_tokens(value)
+        self._store._rows = None
+
+    @property
+    def ntokens(self):
+        """
+        Number of tokens of the string of the Term
+
+        :rtype: int
+        """
+        return self._store.ntokens[self._row]
+
+    @property
+    def count(self):
+        return self._store.count[self._row]
+
+    @count.setter
+    def count(self, value):
+        self._store.count[self._row] = value
+
+    @property
+    def label(self):
+        store = self._store
+        return store._label_table[store.label[self._row]]
+
+    @label.setter
+    def label(self, value):
+        self._store.label[self._row] = self._store.label_code(value)
+
+    @property
+    def order(self):
+        return self._store.order[self._row]
+
+    @order.setter
+    def order(self, value):
+        self._store.order[self._row] = value
+
+    @property
+    def related(self):
+        return self._store.get_related(self._row)
+
+    @related.setter
+    def related(self, value):
+        self._store.set_related(self._row, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Term):
+            return NotImplemented
+
+        return self._store is other._store and self._row == other._row
+
+    def __hash__(self):
+        return hash(self._row)
+
+    def __repr__(self):
+        return (f'Term(index={self.index!r}, string={self.string!r}, '
+                f'count={self.count!r}, label={self.label!r}, '
+                f'order={self.order!r}, related={self.related!r})')
 
     def is_classified(self):
         """
@@ -120,9 +444,233 @@ class Term:
         return self.label != Label.labels['NONE']
 
 
+class SaveJob:
+    """
+    Save operation prepared by a TermList
+
+    The job holds a copy of the data to save, so it can be written at any
+    time, even from another thread, regardless of the changes made to the
+    TermList that prepared it. The TermList checks written and failed when it
+    prepares the next job, to save again the data of a failed job.
+
+    :type target: Path
+    :type full: bool
+    :type written: bool
+    :type failed: bool
+    """
+
+    def __init__(self, target, full, writer, data):
+        """
+        Creates a SaveJob
+
+        :param target: path of the main file handled by the job
+        :type target: Path
+        :param full: if True the job rewrites all the data of target, so it
+            supersedes all the previous jobs with the same target. Otherwise
+            the job appends data to a file
+        :type full: bool
+        :param writer: function that writes data
+        :type writer: Callable[[tuple], None]
+        :param data: the data to write. If full is False, it must be a tuple
+            with the paths of the files and then the list of items to append
+        :type data: tuple
+        """
+        self.target = target
+        self.full = full
+        self.written = False
+        self.failed = False
+        self._writer = writer
+        self._data = data
+        # the jobs merged in self, that are written or failed with self
+        self._merged = []
+
+    def write(self):
+        """
+        Writes the data of the job
+
+        The job and the jobs merged in it are marked as written or as failed.
+        The error of a failed job is raised again.
+        """
+        try:
+            self._writer(self._data)
+        except BaseException:
+            for job in [self] + self._merged:
+                job.failed = True
+            raise
+
+        self._data = None
+        for job in [self] + self._merged:
+            job.written = True
+
+    def merge(self, other):
+        """
+        Merges the data of other in self if both jobs append to the same file
+
+        :param other: the job to merge
+        :type other: SaveJob
+        :return: True if other has been merged in self
+        :rtype: bool
+        """
+        if self.full or other.full or self._writer != other._writer:
+            return False
+
+        *paths, items = self._data
+        *other_paths, other_items = other._data
+        if paths != other_paths:
+            return False
+
+        self._data = (*paths, items + other_items)
+        self._merged.append(other)
+        self._merged.extend(other._merged)
+        return True
+
+
+class TermView:
+    """
+    Lazy read-only sequence of Terms
+
+    A view does not copy the Terms of its sources: they are computed each time
+    the view is iterated, so the view always shows the current content of
+    the sources, and only the Terms actually iterated are computed.
+    Views are combined with filter, with + (concatenation) and with slicing.
+    A view can be iterated in reverse order if all its sources can.
+    """
+
+    def __init__(self, forward, backward=None):
+        """
+        Creates a view
+
+        :param forward: function that gives an iterator over the Terms
+        :type forward: Callable[[], Iterator[Term]]
+        :param backward: function that gives an iterator over the Terms in
+            reverse order. If None (the default), the view cannot be reversed
+        :type backward: Callable[[], Iterator[Term]] or None
+        """
+        self._forward = forward
+        self._backward = backward
+
+    @staticmethod
+    def of(terms):
+        """
+        Gives a view of all the Terms in terms
+
+        :param terms: the Terms to view
+        :type terms: TermList or TermView or list[Term]
+        :return: the view
+        :rtype: TermView
+        """
+        if isinstance(terms, TermView):
+            return terms
+
+        return TermView(lambda: iter(terms), lambda: reversed(terms))
+
+    def __iter__(self):
+        return self._forward()
+
+    def __reversed__(self):
+        if self._backward is None:
+            raise TypeError('this view cannot be reversed')
+
+        return self._backward()
+
+    def __len__(self):
+        # a view has no storage: the Terms must be counted
+        return sum(1 for _ in self)
+
+    @property
+    def items(self):
+        """
+        The Terms in the view as a new list
+
+        :return: the Terms in the view
+        :rtype: list[Term]
+        """
+        return list(self)
+
+    def filter(self, predicate):
+        """
+        Gives a view of the Terms of self that satisfy predicate
+
+        :param predicate: function that tells if a Term must be kept
+        :type predicate: Callable[[Term], bool]
+        :return: the filtered view
+        :rtype: TermView
+        """
+        backward = None
+        if self._backward is not None:
+            def backward():
+                return filter(predicate, self._backward())
+
+        return TermView(lambda: filter(predicate, self._forward()), backward)
+
+    def __add__(self, other):
+        """
+        Concatenates self and other
+
+        If other is not a TermView or a TermList this method returns
+        NotImplemented
+
+        :param other: the Terms to put after the ones of self
+        :type other: TermView or TermList
+        :return: the concatenated view or NotImplemented
+        :rtype: TermView or NotImplementedType
+        """
+        if not isinstance(other, (TermView, TermList)):
+            return NotImplemented
+
+        other = TermView.of(other)
+        backward = None
+        if self._backward is not None and other._backward is not None:
+            def backward():
+                return itertools.chain(reversed(other), reversed(self))
+
+        return TermView(lambda: itertools.chain(self, other), backward)
+
+    def __radd__(self, other):
+        if not isinstance(other, TermList):
+            return NotImplemented
+
+        return TermView.of(other) + self
+
+    def __getitem__(self, key):
+        """
+        Gives a view of a slice of self
+
+        Only the slices with non-negative start and stop, and without step,
+        are supported. The reverse of a slice computes all the Terms of the
+        slice.
+
+        :param key: the slice
+        :type key: slice
+        :return: the view of the slice
+        :rtype: TermView
+        """
+        if not isinstance(key, slice):
+            raise TypeError('a view can only be sliced')
+
+        start, stop = key.start or 0, key.stop
+        if (key.step not in (None, 1) or start < 0
+                or (stop is not None and stop < 0)):
+            raise ValueError('unsupported slice {}'.format(key))
+
+        def forward():
+            return itertools.islice(self._forward(), start, stop)
+
+        return TermView(forward, lambda: reversed(list(forward())))
+
+    def get_strings(self):
+        """
+        Returns the string of each Term
+
+        :return: the string of each Term as a list
+        :rtype: list[str]
+        """
+        return [t.string for t in self]
+
+
 class TermList:
     """
-    :type items: list[Term] or None
+    :type items: list[Term]
     :type csv_header: list[str] or None
     """
 
@@ -133,11 +681,198 @@ class TermList:
         :param items: a list of Term to be included in self. Default: None
         :type items: list[Term] or None
         """
-        self.items = items
+        self._items = {}
+        self._by_string = None
+        # the strings of more than one Term, built with self._by_string
+        self._repeated = None
+        self._by_order = None
+        self._max_order = -1
+        self._label_count = None
+        # indexes of the Terms without classification order, by label
+        self._unordered = None
+        self._list = None
+        self._postings = None
+        # the containment graph of the vocabulary, if loaded (see set_graph)
+        self._graph = None
+        # indexes of the Terms changed since the last save of the service
+        # data. None means that the whole service data must be rewritten
+        self._dirty_service = None
+        self._journal_len = 0
+        # indexes of the Terms with a label changed since the last save of
+        # the tsv file self._tsv_file. None means that the whole tsv file must
+        # be rewritten
+        self._dirty_rows = None
+        self._tsv_file = None
+        # the jobs that save the tsv file and the service data, until they
+        # are written: if one of them fails, the next save is complete
+        self._tsv_jobs = []
+        self._service_jobs = []
         self.csv_header = None
+        if items is not None:
+            self.items = items
+
+    @property
+    def items(self):
+        """
+        The Terms in self as a list
+
+        The Terms are stored in dicts indexed by index and by string. The list
+        is built from them and cached until the next change, so it must not be
+        modified in place: use append, remove and classify_term instead.
+
+        :return: the Terms in self
+        :rtype: list[Term]
+        """
+        if self._list is None:
+            self._list = list(self._items.values())
+
+        return self._list
+
+    @items.setter
+    def items(self, items):
+        """
+        Replaces the Terms in self
+
+        :param items: the new Terms
+        :type items: list[Term]
+        :raise ValueError: if two Terms have the same index
+        """
+        self._items = {t.index: t for t in items}
+        if len(self._items) != len(items):
+            raise ValueError('the indexes of the Terms are not unique')
+
+        self._by_string = None
+        self._repeated = None
+        self._by_order = None
+        self._label_count = None
+        self._unordered = None
+        self._list = None
+        self._postings = None
+        self._graph = None
+        self._dirty_service = None
+        self._dirty_rows = None
 
     def __len__(self):
-        return len(self.items)
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __reversed__(self):
+        return reversed(self._items.values())
+
+    def __contains__(self, string):
+        return string in self._strings()
+
+    def _strings(self):
+        """
+        Gives the index of the Terms by string
+
+        The index is built on first use and then kept in sync with self,
+        together with the set of the strings of more than one Term.
+
+        :return: the dict that maps each string to its Term
+        :rtype: dict[str, Term]
+        """
+        if self._by_string is None:
+            # reversed: if a string is repeated, the first Term wins
+            self._by_string = {t.string: t
+                               for t in reversed(self._items.values())}
+            if len(self._by_string) == len(self._items):
+                self._repeated = set()
+            else:
+                count = collections.Counter(t.string
+                                            for t in self._items.values())
+                self._repeated = {s for s, n in count.items() if n > 1}
+
+        return self._by_string
+
+    def _orders(self):
+        """
+        Gives the index of the classified Terms by classification order
+
+        The index is built on first use, together with the maximum order, and
+        then it is kept in sync by the methods of self that change the order.
+
+        :return: the dict that maps each classification order to its Term
+        :rtype: dict[int, Term]
+        """
+        if self._by_order is None:
+            # reversed: if an order is repeated, the first Term wins
+            self._by_order = {t.order: t
+                              for t in reversed(self._items.values())
+                              if t.order >= 0}
+            self._max_order = max(self._by_order, default=-1)
+
+        return self._by_order
+
+    def _labels(self):
+        """
+        Gives the number of Terms for each label
+
+        The counters are built on first use and then kept in sync by the
+        methods of self that add, remove or classify Terms.
+
+        :return: the number of Terms for each label
+        :rtype: collections.Counter
+        """
+        if self._label_count is None:
+            self._label_count = collections.Counter(t.label for t in
+                                                    self._items.values())
+
+        return self._label_count
+
+    def _unordered_indexes(self, label):
+        """
+        Gives the indexes of the Terms with a label and no classification order
+
+        The sets are built on first use and then kept in sync by the methods of
+        self that add, remove or classify Terms.
+
+        :param label: the label
+        :type label: Label
+        :return: the indexes of the Terms with label and order less than 0
+        :rtype: set[int]
+        """
+        if self._unordered is None:
+            self._unordered = {}
+            for t in self._items.values():
+                if t.order < 0:
+                    self._unordered.setdefault(t.label, set()).add(t.index)
+
+        return self._unordered.setdefault(label, set())
+
+    def _unindex_order(self, term):
+        """
+        Removes term from the order index
+
+        :param term: the Term to remove
+        :type term: Term
+        """
+        if self._by_order is None:
+            return
+
+        if self._by_order.get(term.order) is term:
+            del self._by_order[term.order]
+            # the orders are dense: this loop is amortized O(1)
+            while (self._max_order >= 0
+                   and self._max_order not in self._by_order):
+                self._max_order -= 1
+
+    def _set_order(self, term, order):
+        """
+        Changes the classification order of term updating the order index
+
+        :param term: the Term to change
+        :type term: Term
+        :param order: the new classification order
+        :type order: int
+        """
+        self._unindex_order(term)
+        term.order = order
+        if self._by_order is not None and order >= 0:
+            self._by_order[order] = term
+            self._max_order = max(self._max_order, order)
 
     def __add__(self, other):
         """
@@ -177,6 +912,18 @@ class TermList:
         items = [w for w in self.items if w.string not in filt]
         return TermList(items)
 
+    def view(self):
+        """
+        Gives a lazy view of the Terms in self
+
+        The view shows the Terms in self when it is iterated, also if self is
+        changed after the view is created.
+
+        :return: the view
+        :rtype: TermView
+        """
+        return TermView.of(self)
+
     def get_strings(self):
         """
         Returns the string of each Term
@@ -190,20 +937,71 @@ class TermList:
 
         return strings
 
+    def append(self, term):
+        """
+        Adds term at the end of self
+
+        :param term: the Term to add
+        :type term: Term
+        """
+        self._items[term.index] = term
+        if self._by_string is not None:
+            if term.string in self._by_string:
+                self._repeated.add(term.string)
+            else:
+                self._by_string[term.string] = term
+        if self._by_order is not None and term.order >= 0:
+            self._by_order.setdefault(term.order, term)
+            self._max_order = max(self._max_order, term.order)
+        if self._label_count is not None:
+            self._label_count[term.label] += 1
+        if self._unordered is not None and term.order < 0:
+            self._unordered.setdefault(term.label, set()).add(term.index)
+        self._list = None
+        self._graph = None
+        if self._postings is not None:
+            self._index_term(term)
+
     def remove(self, strings):
         """
         Removes the terms with the specified strings in place
 
+        All the Terms with one of the strings are removed, also if a string is
+        repeated.
+
         :param strings: list of string to look for
         :type strings: list[str]
         """
-        idx = []
-        for i, t in enumerate(list(self.items)):
-            if t.string in strings:
-                idx.append(i)
+        for s in strings:
+            t = self._strings().pop(s, None)
+            if t is None:
+                continue
+
+            if s in self._repeated:
+                # only the first Term with s is in the index
+                self._repeated.discard(s)
+                for u in [u for u in self._items.values() if u.string == s]:
+                    self._discard(u)
+            else:
+                self._discard(t)
+
+    def _discard(self, t):
+        """
+        Removes a Term from self and from its indexes, except the string index
 
-        for i in reversed(idx):
-            del self.items[i]
+        :param t: the Term to remove
+        :type t: Term
+        """
+        del self._items[t.index]
+        self._list = None
+        self._graph = None
+        self._unindex_order(t)
+        if self._label_count is not None:
+            self._label_count[t.label] -= 1
+        if self._unordered is not None and t.order < 0:
+            self._unordered[t.label].discard(t.index)
+        if self._postings is not None:
+            self._unindex_term(t)
 
     def get(self, string):
         """
@@ -216,29 +1014,51 @@ class TermList:
         :return: the Term found or None
         :rtype: Term or None
         """
-        for t in self.items:
-            if t.string == string:
-                return t
-
-        return None
+        return self._strings().get(string)
 
-    def sort_by_order(self, ascending=True):
+    def get_by_index(self, index):
         """
-        Sorts the TermList by order in place
+        Finds the Term with the specified index
 
-        :param ascending: if True, sort in ascending order.
-        :type ascending: bool
+        If no Term t satisfies the condition t.index == index than None is
+        returned.
+        :param index: the index to be searched
+        :type index: int
+        :return: the Term found or None
+        :rtype: Term or None
         """
-        self.items.sort(key=lambda t: t.order, reverse=not ascending)
+        return self._items.get(index)
 
-    def sort_by_index(self, ascending=True):
+    def _sort(self, key, ascending):
         """
-        Sorts the TermList by index in place
+        Sorts the TermList in place
 
+        :param key: function that gives the sorting key of a Term
+        :type key: Callable[[Term], Any]
         :param ascending: if True, sort in ascending order.
         :type ascending: bool
         """
-        self.items.sort(key=lambda t: t.index, reverse=not ascending)
+        items = sorted(self._items.values(), key=key, reverse=not ascending)
+        self._items = {t.index: t for t in items}
+        self._list = items
+
+    def sort_by_order(self, ascending=True):
+        """
+        Sorts the TermList by order in place
+
+        :param ascending: if True, sort in ascending order.
+        :type ascending: bool
+        """
+        self._sort(lambda t: t.order, ascending)
+
+    def sort_by_index(self, ascending=True):
+        """
+        Sorts the TermList by index in place
+
+        :param ascending: if True, sort in ascending order.
+        :type ascending: bool
+        """
+        self._sort(lambda t: t.index, ascending)
 
     def get_from_label(self, label, order_set=None):
         """
@@ -291,26 +1111,47 @@ class TermList:
         items = [t for t in self.items if t.label != Label.labels['NONE']]
         return TermList(items)
 
-    def from_tsv(self, infile):
+    def from_tsv(self, infile, max_rows=None):
         """
         Gets the terms from a tsv file
 
+        The labels appended by to_tsv to the delta file (the path in infile
+        stripped by the extension, with the suffix '_fawoc_delta.tsv') are
+        applied to the terms read.
+        If max_rows is given, only the first max_rows rows are read. The list
+        read in this way is only a preview of the file: it must not be saved.
         :param infile: path to the tsv file to read
         :type infile: str
+        :param max_rows: maximum number of rows to read. Default: None (all)
+        :type max_rows: int or None
         :return: the tsv header and the list of terms read by the file
         :rtype: (list[str], list[Term])
+        :raise InvalidTsvError: if two rows have the same id
         """
-        with open(infile, newline='', encoding='utf-8') as csv_file:
-            csv_reader = csv.DictReader(csv_file, delimiter='\t')
+        with utils.TsvColumnReader(infile, TSV_COLUMNS) as csv_reader:
             header = csv_reader.fieldnames
+            columns = set(header or [])
+            store = TermStore()
             items = []
+            ids = set()
             for i, row in enumerate(csv_reader):
-                lbl_name = row.get('label', '')
+                if max_rows is not None and i >= max_rows:
+                    break
+
+                (id_value, term_value, keyword_value, lbl_name, order_value,
+                 related, count_value) = row
+                if 'label' not in columns:
+                    lbl_name = ''
+
                 label = Label.get_from_name(lbl_name)
 
-                try:
-                    idx = int(row['id'])
-                except KeyError:
+                if 'id' in columns:
+                    idx = int(id_value)
+                    if idx in ids:
+                        raise InvalidTsvError(f'id {idx} is repeated')
+
+                    ids.add(idx)
+                else:
                     idx = i
 
                 # order and related are usually read from the service data file
@@ -318,25 +1159,27 @@ class TermList:
                 # read them here in case fawoc is run with an older tsv file,
                 # without the fawoc service files. In this way we are able to
                 # convert old files to the new format
-                order_value = row.get('order', '')
-                if order_value == '':
+                if 'order' not in columns or order_value == '':
                     order = -1
                 else:
                     order = int(order_value)
 
-                related = row.get('related', '')
+                if 'related' not in columns:
+                    related = ''
 
-                try:
-                    count = int(row['count'])
-                except KeyError:
+                if 'count' in columns:
+                    count = int(count_value)
+                else:
                     count = -1
 
-                try:
-                    term = row['term']
-                except KeyError:
-                    term = row['keyword']
+                if 'term' in columns:
+                    term = term_value
+                elif 'keyword' in columns:
+                    term = keyword_value
+                else:
+                    raise KeyError('keyword')
 
-                item = Term(
+                row = store.add(
                     index=idx,
                     string=term,
                     count=count,
@@ -344,12 +1187,215 @@ class TermList:
                     order=order,
                     related=related
                 )
-                items.append(item)
+                items.append(store.view(row))
 
         self.csv_header = header
         self.items = items
+        file = Path(infile).resolve()
+        delta_valid = self._load_tsv_delta(file)
+        if max_rows is not None:
+            return header, items
+
+        if header == ['id', 'term', 'label'] and delta_valid:
+            # infile was written by to_tsv: it can be updated with the delta
+            self._dirty_rows = set()
+            self._tsv_file = file
+
+        self.build_postings()
         return header, items
 
+    def _load_tsv_delta(self, tsvfile):
+        """
+        Applies the labels saved in the delta file of tsvfile
+
+        See read_tsv_delta for the rows that are applied.
+
+        :param tsvfile: path to the tsv file
+        :type tsvfile: Path
+        :return: True if the delta file is missing or it is applied whole,
+            False if it is ignored in whole or in part
+        :rtype: bool
+        """
+        labels, complete = self.read_tsv_delta(tsvfile)
+        for idx, label in labels.items():
+            t = self._items.get(idx)
+            if t is not None:
+                t.label = label
+
+        return complete
+
+    @staticmethod
+    def read_tsv_delta(tsvfile):
+        """
+        Reads the labels saved in the delta file of tsvfile
+
+        The first row of the delta file identifies the version of tsvfile it
+        applies to (see _delta_tag): a delta file of another version of
+        tsvfile is ignored. The other rows have the same format of the file
+        written by to_tsv. They are read in order, so the last label saved
+        for a term wins. Only the complete rows are read: a row truncated by a
+        crash and the rows after it are ignored.
+
+        :param tsvfile: path to the tsv file
+        :type tsvfile: Path
+        :return: the label of each id changed by the delta file, and True if
+            the delta file is missing or it is read whole, False if it is
+            ignored in whole or in part
+        :rtype: (dict[int, Label], bool)
+        """
+        labels = {}
+        name = '_'.join([tsvfile.stem, 'fawoc_delta.tsv'])
+        try:
+            with open(tsvfile.parent / name, newline='',
+                      encoding='utf-8') as csv_file:
+                lines = csv_file.readlines()
+        except FileNotFoundError:
+            return labels, True
+
+        # the last line is truncated if a crash interrupted its write
+        complete = len(lines) == 0 or lines[-1].endswith('\n')
+        if not complete:
+            lines.pop()
+
+        csv_reader = csv.reader(lines, delimiter='\t')
+        try:
+            if (next(csv_reader, None) != TermList._delta_tag(tsvfile)
+                    or next(csv_reader, None) != ['id', 'term', 'label']):
+                return {}, False
+
+            for row in csv_reader:
+                if len(row) != 3:
+                    return labels, False
+
+                labels[int(row[0])] = Label.get_from_name(row[2])
+        except (csv.Error, ValueError):
+            return labels, False
+
+        return labels, complete
+
+    @staticmethod
+    def _delta_tag(tsvfile):
+        """
+        Gives the first row of the delta file of tsvfile
+
+        The row holds the size and the modification time of tsvfile, so it
+        ties the delta file to the version of tsvfile that was on disk when the
+        delta file was created.
+
+        :param tsvfile: path to the tsv file
+        :type tsvfile: Path
+        :return: the first row of the delta file
+        :rtype: list[str]
+        """
+        st = tsvfile.stat()
+        return ['base', str(st.st_size), str(st.st_mtime_ns)]
+
+    def build_postings(self):
+        """
+        Builds the token inverted index used to find the related terms
+
+        The index maps each token (as given by str.split) to the Terms that
+        contain it. The strings of the Terms never change, so the index stays
+        valid across classifications and undo; it must be rebuilt only if
+        self.items is replaced.
+        """
+        self._postings = {}
+        for t in self.items:
+            self._index_term(t)
+
+    def _index_term(self, term):
+        """
+        Adds term to the token inverted index
+
+        :param term: the Term to add
+        :type term: Term
+        """
+        for tok in set(term.string.split()):
+            self._postings.setdefault(tok, {})[term] = None
+
+    def _unindex_term(self, term):
+        """
+        Removes term from the token inverted index
+
+        :param term: the Term to remove
+        :type term: Term
+        """
+        for tok in set(term.string.split()):
+            posting = self._postings.get(tok)
+            if posting is None:
+                continue
+            posting.pop(term, None)
+            if not posting:
+                del self._postings[tok]
+
+    def _candidates(self, key):
+        """
+        Finds the Terms that contain all the tokens of key
+
+        The result is a superset of the Terms related to key, since every Term
+        that contains key between word boundaries contains all its tokens.
+        If key has no token, None is returned.
+
+        :param key: the string to search
+        :type key: str
+        :return: the candidate Terms or None
+        :rtype: list[Term] or None
+        """
+        tokens = set(key.split())
+        if len(tokens) == 0:
+            return None
+
+        if self._postings is None:
+            self.build_postings()
+
+        postings = []
+        for tok in tokens:
+            posting = self._postings.get(tok)
+            if posting is None:
+                return []
+            postings.append(posting)
+
+        postings.sort(key=len)
+        first, others = postings[0], postings[1:]
+        return [t for t in first if all(t in p for p in others)]
+
+    def set_graph(self, graph):
+        """
+        Sets the containment graph used to find the related terms
+
+        The graph must be built on the same vocabulary of self (see
+        graph.load_graph). It is dropped if a Term is added to or removed from
+        self, and it is not saved in the cache.
+
+        :param graph: the graph or None to search the related terms at runtime
+        :type graph: ContainmentGraph or None
+        """
+        self._graph = graph
+
+    def _graph_related(self, key):
+        """
+        Finds the Terms that contain key with the containment graph
+
+        :param key: the string to search
+        :type key: str
+        :return: the Terms that contain key, or None if there is no graph or
+            key is not a term with tokens in the graph
+        :rtype: list[Term] or None
+        """
+        if self._graph is None or len(key.split()) == 0:
+            return None
+
+        term = self.get(key)
+        if term is None:
+            return None
+
+        containing = self._graph.containing(term.index)
+        if containing is None:
+            return None
+
+        items = self._items
+        return [term] + [items[idx] for idx in containing if idx in items]
+
     def load_service_data(self, tsvfile, load_invariant=True):
         """
         Loads the service data of fawoc from the fawoc_data files
@@ -360,7 +1406,9 @@ class TermList:
         The new path, with the '.tsv' extension, is loaded for the invariant
         data (like the 'count' field).
         The variable data ('order' and 'related') is loaded from the new path
-        with the '.json' extension.
+        with the '.json' extension. Then the changes appended by
+        save_service_data to the journal (the new path with the '.journal'
+        extension) are applied to it.
 
         :param tsvfile: path to the tsv file loaded by fawoc
         :type tsvfile: str or Path
@@ -391,9 +1439,46 @@ class TermList:
                 raise InvalidServiceDataError('the loaded data is not a dict')
 
             data = {int(k): v for k, v in data.items()}
+            snapshot = True
         except FileNotFoundError:
             data = {}
+            snapshot = False
+
+        name = '_'.join([path.stem, 'fawoc_data.journal'])
+        journal_len = 0
+        truncated = False
+        try:
+            with open(p / name, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        if not line.endswith('\n'):
+                            raise ValueError('missing newline')
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line truncated by a crash: the entries after it
+                        # cannot be trusted
+                        truncated = True
+                        break
+                    try:
+                        idx = int(entry['id'])
+                        if entry['order'] >= 0:
+                            data[idx] = {
+                                'order': entry['order'],
+                                'related': entry['related'],
+                            }
+                        else:
+                            data.pop(idx, None)
+                    except (KeyError, TypeError, ValueError):
+                        s = f'Invalid journal entry {line.strip()!r}'
+                        raise InvalidServiceDataError(s)
+                    journal_len += 1
+        except FileNotFoundError:
+            pass
 
+        # the order of the Terms is changed below: rebuild the indexes on next
+        # use
+        self._by_order = None
+        self._unordered = None
         for t in self.items:
             # try to get data from the fawoc_data service file
             try:
@@ -428,16 +1513,76 @@ class TermList:
                     s = f'Entry {repr(t.index)} is not a dict'
                     raise InvalidServiceDataError(s)
 
-    def save_service_data(self, tsvfile, save_invariant=True):
+        # the journal can be used only on top of an existing json file and
+        # cannot be appended after a truncated line: in these cases the next
+        # save rewrites the json file
+        self._dirty_service = set() if snapshot and not truncated else None
+        self._journal_len = journal_len
+
+    def clear_order(self):
+        """
+        Removes the classification order and the related term from all the Terms
+        """
+        for t in self._items.values():
+            t.order = -1
+            t.related = ''
+
+        self._by_order = None
+        self._unordered = None
+        self._dirty_service = None
+
+    def save_service_data(self, tsvfile, save_invariant=True, compact=True):
         """
         Saves the service data of fawoc to the fawoc_data files
 
         See the docstring of load_service_data for info about the fawoc_data files
+        If compact is False, only the Terms changed since the last save are
+        appended to the journal file, so the cost does not depend on the
+        number of classified terms. The json file is rewritten (and the
+        journal removed) if compact is True, if the journal has more than
+        JOURNAL_COMPACT_THRESHOLD entries or if the json file was not loaded
+        by load_service_data.
 
         :param tsvfile: path to the tsv file loaded by fawoc
         :type tsvfile: str or Path
         :param save_invariant: if True (the default) the invariant data is saved
         :type save_invariant: bool
+        :param compact: if True (the default) the json file is rewritten
+        :type compact: bool
+        """
+        self.service_data_job(tsvfile, save_invariant=save_invariant,
+                              compact=compact).write()
+
+    @staticmethod
+    def _failed(jobs):
+        """
+        Drops the written jobs from jobs and tells if one of the others failed
+
+        :param jobs: the jobs prepared by self
+        :type jobs: list[SaveJob]
+        :return: True if one of the jobs failed
+        :rtype: bool
+        """
+        jobs[:] = [j for j in jobs if not j.written]
+        return any(j.failed for j in jobs)
+
+    def service_data_job(self, tsvfile, save_invariant=True, compact=True):
+        """
+        Prepares the save of the service data of fawoc
+
+        The data to save is copied in the returned SaveJob, so the job can be
+        written later, even from another thread, while self is changed.
+        See save_service_data for the meaning of the arguments. If a job
+        prepared before failed, the json file is rewritten.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :param save_invariant: if True (the default) the invariant data is saved
+        :type save_invariant: bool
+        :param compact: if True (the default) the json file is rewritten
+        :type compact: bool
+        :return: the job that saves the service data
+        :rtype: SaveJob
         """
         file = Path(tsvfile).resolve()
         path = file.parent
@@ -445,6 +1590,22 @@ class TermList:
         service_tsv = path / name
         name = '_'.join([file.stem, 'fawoc_data.json'])
         service_json = path / name
+        name = '_'.join([file.stem, 'fawoc_data.journal'])
+        service_journal = path / name
+        if self._failed(self._service_jobs):
+            # the data of the failed job is saved again by a complete save
+            compact = True
+
+        if (not compact and self._dirty_service is not None
+                and self._journal_len < JOURNAL_COMPACT_THRESHOLD
+                and service_json.exists()):
+            lines = self._journal_lines()
+            self._journal_len += len(lines)
+            job = SaveJob(service_json, False, self._write_journal,
+                          (service_journal, lines))
+            self._service_jobs.append(job)
+            return job
+
         save_other_data = save_invariant and not service_tsv.exists()
         service_data = {}
         other_data = []
@@ -462,6 +1623,28 @@ class TermList:
                 }
         if save_other_data:
             other_data.sort(key=lambda r: r['id'])
+        else:
+            other_data = None
+
+        self._dirty_service = set()
+        self._journal_len = 0
+        job = SaveJob(service_json, True, self._write_service_data,
+                      (service_tsv, service_json, service_journal,
+                       other_data, service_data))
+        self._service_jobs = [job]
+        return job
+
+    @staticmethod
+    def _write_service_data(data):
+        """
+        Writes all the service data
+
+        :param data: the paths of the invariant tsv, of the json and of the
+            journal; the invariant data (or None) and the variable data
+        :type data: tuple
+        """
+        service_tsv, service_json, service_journal, other_data, service_data = data
+        if other_data is not None:
             with open(service_tsv, 'w', newline='', encoding='utf-8') as f:
                 csv_writer = csv.DictWriter(f, other_data[0].keys(),
                                             delimiter='\t', quotechar='"',
@@ -469,41 +1652,484 @@ class TermList:
                 csv_writer.writeheader()
                 csv_writer.writerows(other_data)
 
-        with tempfile.NamedTemporaryFile('w', dir=str(path), encoding='utf-8',
+        with tempfile.NamedTemporaryFile('w', dir=str(service_json.parent),
+                                         encoding='utf-8',
                                          prefix='.fawoc.temp.',
                                          delete=False) as out:
             json.dump(service_data, out)  # , indent='\t')
             temp = Path(out.name)
 
         temp.replace(service_json)
+        # the json file contains all the entries of the journal
+        try:
+            service_journal.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _journal_lines(self):
+        """
+        Gives the journal lines of the Terms changed since the last save
+
+        Each line of the journal is a json dict with the 'id', 'order' and
+        'related' of a Term. A negative order means that the Term is no longer
+        classified.
+
+        :return: the lines to append to the journal
+        :rtype: list[str]
+        """
+        lines = []
+        for idx in sorted(self._dirty_service):
+            t = self._items.get(idx)
+            if t is None:
+                continue
+            if t.is_classified():
+                entry = {'id': t.index, 'order': t.order, 'related': t.related}
+            else:
+                entry = {'id': t.index, 'order': -1, 'related': ''}
+            lines.append(json.dumps(entry) + '\n')
+
+        self._dirty_service = set()
+        return lines
+
+    @staticmethod
+    def _write_journal(data):
+        """
+        Appends lines to the journal and flushes it to disk
+
+        :param data: the path of the journal and the lines to append
+        :type data: (Path, list[str])
+        """
+        journal, lines = data
+        if len(lines) == 0:
+            return
+
+        with open(journal, 'a', encoding='utf-8') as out:
+            out.writelines(lines)
+            out.flush()
+            os.fsync(out.fileno())
+
+    @staticmethod
+    def _cache_files(tsvfile):
+        """
+        Gives the path of the snapshot cache of tsvfile and of its sources
+
+        The sources are tsvfile, its delta file and its fawoc_data files.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :return: the path of the cache and the paths of the sources
+        :rtype: (Path, list[Path])
+        """
+        file = Path(tsvfile).resolve()
+        path = file.parent
+        cache = path / '_'.join([file.stem, 'fawoc_cache.bin'])
+        sources = [file]
+        for suffix in ['fawoc_delta.tsv', 'fawoc_data.tsv', 'fawoc_data.json',
+                       'fawoc_data.journal']:
+            sources.append(path / '_'.join([file.stem, suffix]))
+
+        return cache, sources
+
+    @staticmethod
+    def _cache_key(sources, invariant):
+        """
+        Computes the key that identifies the content of the source files
+
+        For each source the key contains its path, size, modification time and
+        the hash of its content, or only the path if the file does not exist.
+
+        :param sources: paths of the source files
+        :type sources: list[Path]
+        :param invariant: if the invariant data was loaded
+        :type invariant: bool
+        :return: the key
+        :rtype: list
+        """
+        key = [CACHE_VERSION, invariant]
+        for src in sources:
+            try:
+                with open(src, 'rb') as file:
+                    stat = os.fstat(file.fileno())
+                    digest = hashlib.blake2b()
+                    for chunk in iter(lambda: file.read(1 << 20), b''):
+                        digest.update(chunk)
+            except FileNotFoundError:
+                key.append((str(src), ))
+                continue
+
+            key.append((str(src), stat.st_size, stat.st_mtime_ns,
+                        digest.hexdigest()))
+
+        return key
+
+    def save_cache(self, tsvfile, save_invariant=True):
+        """
+        Saves a binary snapshot of self in the cache file of tsvfile
+
+        The cache file is the path in tsvfile stripped by the extension, with
+        the suffix '_fawoc_cache.bin'. The snapshot holds the Terms of self and
+        its save state, and it is keyed by the content of tsvfile and of the
+        files loaded with it (see load_cache). So it must be saved right after
+        a complete save with to_tsv and save_service_data.
+        The file holds no code: after a header, the key and the strings are
+        json documents, and the integer columns of the Terms are arrays. The
+        header holds a hash of the rest of the file, to detect a damaged file.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :param save_invariant: if the invariant data was saved by
+            save_service_data. Default: True
+        :type save_invariant: bool
+        """
+        cache, sources = self._cache_files(tsvfile)
+        key = self._cache_key(sources, save_invariant)
+        items = self.items
+        # the labels are saved as codes in the table of their names
+        codes = {}
+        labels = array('B', (codes.setdefault(t.label, len(codes))
+                             for t in items))
+        related = [[row, t.related] for row, t in enumerate(items)
+                   if t.related != '']
+        # the token index is saved as lists of positions in items
+        tokens = None
+        offsets = array('Q', [0])
+        targets = array('I')
+        if self._postings is not None:
+            tokens = list(self._postings)
+            rows = {t.index: row for row, t in enumerate(items)}
+            for tok in tokens:
+                targets.extend(rows[t.index] for t in self._postings[tok])
+                offsets.append(len(targets))
+
+        data = {
+            'csv_header': self.csv_header,
+            'tsv_file': None if self._tsv_file is None else str(self._tsv_file),
+            'dirty_rows': (None if self._dirty_rows is None
+                           else sorted(self._dirty_rows)),
+            'dirty_service': (None if self._dirty_service is None
+                              else sorted(self._dirty_service)),
+            'journal_len': self._journal_len,
+            'labels': [lbl[0] for lbl in codes],
+            'strings': [t.string for t in items],
+            'related': related,
+            'tokens': tokens,
+        }
+        arrays = [
+            array('q', (t.index for t in items)),
+            array('q', (t.count for t in items)),
+            array('q', (t.order for t in items)),
+            labels,
+            array('H', (t.ntokens for t in items)),
+            offsets,
+            targets,
+        ]
+        key = json.dumps(key).encode('utf-8')
+        data = json.dumps(data).encode('utf-8')
+        body = io.BytesIO()
+        body.write(data)
+        for a in arrays:
+            if sys.byteorder == 'big':
+                a.byteswap()
+            a.tofile(body)
+
+        body = body.getvalue()
+        digest = hashlib.blake2b(key + body, digest_size=32).digest()
+        with tempfile.NamedTemporaryFile('wb', dir=str(cache.parent),
+                                         prefix='.fawoc.temp.',
+                                         delete=False) as out:
+            out.write(_CACHE_HEADER.pack(_CACHE_MAGIC, CACHE_VERSION,
+                                         len(key), len(data), digest))
+            out.write(key)
+            out.write(body)
+            temp = Path(out.name)
+
+        temp.replace(cache)
+
+    @staticmethod
+    def load_cache(tsvfile, load_invariant=True):
+        """
+        Loads the TermList saved by save_cache for tsvfile
+
+        The snapshot is loaded only if tsvfile, its delta file and its
+        fawoc_data files are the same of when it was saved. The TermList is
+        the one that from_tsv, load_service_data and sort_by_order would give
+        from the same files.
+
+        :param tsvfile: path to the tsv file loaded by fawoc
+        :type tsvfile: str or Path
+        :param load_invariant: if True (the default) the invariant data is
+            loaded into fawoc
+        :type load_invariant: bool
+        :return: the TermList or None if the cache is missing, stale or
+            invalid
+        :rtype: TermList or None
+        """
+        cache, sources = TermList._cache_files(tsvfile)
+        try:
+            with open(cache, 'rb') as file:
+                header = file.read(_CACHE_HEADER.size)
+                if len(header) != _CACHE_HEADER.size:
+                    raise ValueError('truncated header')
+
+                (magic, version, key_len, data_len,
+                 digest) = _CACHE_HEADER.unpack(header)
+                if magic != _CACHE_MAGIC or version != CACHE_VERSION:
+                    return None
+
+                key = file.read(key_len)
+                # the key is compared as it is read back from json
+                expected = TermList._cache_key(sources, load_invariant)
+                if json.loads(key.decode('utf-8')) != json.loads(
+                        json.dumps(expected)):
+                    return None
+
+                body = file.read()
+
+            if hashlib.blake2b(key + body, digest_size=32).digest() != digest:
+                raise ValueError('wrong hash')
+
+            body = io.BytesIO(body)
+            data = json.loads(body.read(data_len).decode('utf-8'))
+            n = len(data['strings'])
+            tokens = data['tokens']
+            arrays = []
+            for typecode in 'qqqBH':
+                arrays.append(TermList._read_array(body, typecode, n))
+
+            if tokens is None:
+                arrays.extend([array('Q'), array('I')])
+            else:
+                offsets = TermList._read_array(body, 'Q', len(tokens) + 1)
+                arrays.append(offsets)
+                arrays.append(TermList._read_array(body, 'I', offsets[-1]))
+
+            terms = TermList._from_cache_data(data, arrays)
+        except FileNotFoundError:
+            return None
+        except (EOFError, IndexError, KeyError, TypeError,
+                ValueError) as err:
+            # json.JSONDecodeError and UnicodeDecodeError are ValueError
+            debug_logger.warning(f'invalid cache file {cache}: {err!r}')
+            return None
+
+        return terms
+
+    @staticmethod
+    def _read_array(file, typecode, n):
+        """
+        Reads an array written in little endian order
+
+        :param file: the file to read
+        :type file: BinaryIO
+        :param typecode: the type code of the array
+        :type typecode: str
+        :param n: the number of items to read
+        :type n: int
+        :return: the array
+        :rtype: array
+        :raise EOFError: if the file has less than n items
+        """
+        a = array(typecode)
+        a.fromfile(file, n)
+        if sys.byteorder == 'big':
+            a.byteswap()
+
+        return a
+
+    @staticmethod
+    def _from_cache_data(data, arrays):
+        """
+        Builds the TermList saved in a snapshot cache
+
+        :param data: the json data of the snapshot
+        :type data: dict
+        :param arrays: the index, count, order, label and ntokens columns and
+            the offsets and the targets of the token index
+        :type arrays: list[array]
+        :return: the TermList
+        :rtype: TermList
+        :raise ValueError: if the data is not valid
+        """
+        index, count, order, label, ntokens, offsets, targets = arrays
+        strings = data['strings']
+        if not all(isinstance(s, str) for s in strings):
+            raise ValueError('the strings of the terms are not str')
+
+        store = TermStore()
+        # from the codes of the snapshot to the codes of the store
+        codes = [store.label_code(Label.get_from_name(name))
+                 for name in data['labels']]
+        if codes != list(range(len(codes))):
+            label = array('B', (codes[c] for c in label))
+        elif len(label) > 0 and max(label) >= len(codes):
+            raise ValueError('unknown label code')
+
+        store.index = index
+        store.count = count
+        store.order = order
+        store.label = label
+        store.related = array('q', [TermStore.RELATED_NONE]) * len(strings)
+        store.ntokens = ntokens
+        store.strings = strings
+        for row, related in data['related']:
+            if not isinstance(related, str) or not 0 <= row < len(strings):
+                raise ValueError('invalid related string')
+            store.set_related(row, related)
+
+        terms = TermList()
+        terms.items = [store.view(row) for row in range(len(strings))]
+        terms.csv_header = data['csv_header']
+        if data['tsv_file'] is not None:
+            terms._tsv_file = Path(data['tsv_file'])
+        if data['dirty_rows'] is not None:
+            terms._dirty_rows = set(data['dirty_rows'])
+        if data['dirty_service'] is not None:
+            terms._dirty_service = set(data['dirty_service'])
+        terms._journal_len = int(data['journal_len'])
+        tokens = data['tokens']
+        if tokens is None:
+            terms.build_postings()
+        else:
+            items = terms.items
+            terms._postings = {
+                tok: dict.fromkeys([items[p]
+                                    for p in targets[offsets[i]:offsets[i + 1]]])
+                for i, tok in enumerate(tokens)
+            }
 
-    def to_tsv(self, outfile):
+        return terms
+
+    def to_tsv(self, outfile, incremental=False):
         """
         Saves the terms in a tsv file
 
         No service data (order and related) are written.
+        If incremental is True and outfile is the file loaded with from_tsv or
+        written by the last call to this method, only the terms with a label
+        changed since then are appended to the delta file of outfile (see
+        from_tsv). Otherwise the whole outfile is rewritten, merging and
+        removing the delta file.
         :param outfile: path to the tsv file to write the terms
         :type outfile: str
+        :param incremental: if True only the changed terms are saved if
+            possible. Default: False
+        :type incremental: bool
+        """
+        self.tsv_job(outfile, incremental=incremental).write()
+
+    def tsv_job(self, outfile, incremental=False):
         """
+        Prepares the save of the terms in a tsv file
+
+        The data to save is copied in the returned SaveJob, so the job can be
+        written later, even from another thread, while self is changed.
+        See to_tsv for the meaning of the arguments. If a job prepared before
+        failed, the whole file is saved.
+
+        :param outfile: path to the tsv file to write the terms
+        :type outfile: str
+        :param incremental: if True only the changed terms are saved if
+            possible. Default: False
+        :type incremental: bool
+        :return: the job that saves the terms
+        :rtype: SaveJob
+        """
+        file = Path(outfile).resolve()
+        name = '_'.join([file.stem, 'fawoc_delta.tsv'])
+        delta = file.parent / name
+        if self._failed(self._tsv_jobs):
+            # the data of the failed job is saved again by a complete save
+            incremental = False
+
+        if (incremental and self._dirty_rows is not None
+                and self._tsv_file == file):
+            rows = []
+            for idx in sorted(self._dirty_rows):
+                w = self._items.get(idx)
+                if w is not None:
+                    rows.append((w.index, w.string, w.label[0]))
+
+            self._dirty_rows = set()
+            job = SaveJob(file, False, self._write_tsv_delta,
+                          (file, delta, rows))
+            self._tsv_jobs.append(job)
+            return job
+
         items = sorted(self.items, key=lambda t: t.index)
-        path = str(Path(outfile).resolve().parent)
+        rows = [(w.index, w.string, w.label[0]) for w in items]
+        self._dirty_rows = set()
+        self._tsv_file = file
+        job = SaveJob(file, True, self._write_tsv, (file, delta, rows))
+        self._tsv_jobs = [job]
+        return job
+
+    @staticmethod
+    def _write_tsv(data):
+        """
+        Writes the whole tsv file
+
+        :param data: the path of the tsv file and of its delta file, and the
+            rows to write
+        :type data: (Path, Path, list[tuple[int, str, str]])
+        """
+        outfile, delta, rows = data
+        path = str(outfile.parent)
         with tempfile.NamedTemporaryFile('w', dir=path, prefix='.fawoc.temp.',
                                          encoding='utf-8', delete=False, newline='') as out:
             writer = csv.DictWriter(out, delimiter='\t', quotechar='"',
                                     fieldnames=['id', 'term', 'label'],
                                     quoting=csv.QUOTE_MINIMAL)
             writer.writeheader()
-            for w in items:
+            for index, string, label in rows:
                 item = {
-                    'id': w.index,
-                    'term': w.string,
-                    'label': w.label[0],
+                    'id': index,
+                    'term': string,
+                    'label': label,
                 }
                 writer.writerow(item)
 
             temp = Path(out.name)
 
         temp.replace(outfile)
+        # outfile contains all the labels of the delta file
+        try:
+            delta.unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _write_tsv_delta(data):
+        """
+        Appends rows to the delta file of a tsv file and flushes it to disk
+
+        A new delta file starts with the row that ties it to the tsv file (see
+        _delta_tag).
+
+        :param data: the path of the tsv file and of its delta file, and the
+            rows to append
+        :type data: (Path, Path, list[tuple[int, str, str]])
+        """
+        outfile, delta, rows = data
+        if len(rows) == 0:
+            return
+
+        new_file = not delta.exists()
+        with open(delta, 'a', encoding='utf-8', newline='') as out:
+            writer = csv.DictWriter(out, delimiter='\t', quotechar='"',
+                                    fieldnames=['id', 'term', 'label'],
+                                    quoting=csv.QUOTE_MINIMAL)
+            if new_file:
+                csv.writer(out, delimiter='\t').writerow(
+                    TermList._delta_tag(outfile))
+                writer.writeheader()
+            for index, string, label in rows:
+                writer.writerow({
+                    'id': index,
+                    'term': string,
+                    'label': label,
+                })
+            out.flush()
+            os.fsync(out.fileno())
 
     def get_last_classified_order(self):
         """
@@ -512,11 +2138,8 @@ class TermList:
         :return: the classification order of the last classified term
         :rtype: int
         """
-        order = max(w.order for w in self.items)
-        if order < 0:
-            order = -1
-
-        return order
+        self._orders()
+        return self._max_order
 
     def get_last_classified_term(self):
         """
@@ -525,14 +2148,7 @@ class TermList:
         :return: the last classified term
         :rtype: Term or None
         """
-        last = self.get_last_classified_order()
-        if last < 0:
-            return None
-        for w in self.items:
-            if w.order == last:
-                return w
-        else:
-            return None
+        return self._orders().get(self._max_order)
 
     def classify_term(self, term, label, order, related=''):
         """
@@ -559,17 +2175,163 @@ class TermList:
         :return: self
         :rtype: TermList
         """
-        for i, w in enumerate(self.items):
-            if w.string == term:
-                w.label = label
-                w.order = order
-                w.related = related
-                del self.items[i]
-                self.items.append(w)
-                break
+        w = self._strings().get(term)
+        if w is not None:
+            self.classify_item(w, label, order, related)
+
+        return self
+
+    def classify_item(self, item, label, order, related=''):
+        """
+        Classifies a Term of self
+
+        Unlike classify_term, the Term is not searched by its string, so this
+        method classifies the right Term also if its string is repeated.
+        See classify_term for the meaning of the other arguments.
+        This method return self.
+
+        :param item: the Term in self to classify
+        :type item: Term
+        :param label: the Label to be assigned to the term
+        :type label: Label
+        :param order: the classification order
+        :type order: int
+        :param related: related term (if any). Default: ''
+        :type related: str
+        :return: self
+        :rtype: TermList
+        """
+        self._classify(item, label, order, related)
+        return self
+
+    def classify_terms(self, terms, label, order, related=''):
+        """
+        Classifies many terms with the same label and related term
+
+        The terms get consecutive classification orders, starting from order,
+        in the order of the list. If order is less than 0, all the terms get
+        no classification order. The cost is proportional to the number of
+        terms. See classify_term.
+        This method return self.
+
+        :param terms: the terms to classify
+        :type terms: list[str]
+        :param label: the Label to be assigned to the terms
+        :type label: Label
+        :param order: the classification order of the first term
+        :type order: int
+        :param related: related term (if any). Default: ''
+        :type related: str
+        :return: self
+        :rtype: TermList
+        """
+        strings = self._strings()
+        for term in terms:
+            w = strings.get(term)
+            if w is not None:
+                self._classify(w, label, order, related)
+
+            if order >= 0:
+                order += 1
 
         return self
 
+    def classify_items(self, items, label, order, related=''):
+        """
+        Classifies many Terms of self with the same label and related term
+
+        Unlike classify_terms, the Terms are not searched by their strings.
+        See classify_terms for the meaning of the other arguments.
+        This method return self.
+
+        :param items: the Terms in self to classify
+        :type items: list[Term]
+        :param label: the Label to be assigned to the terms
+        :type label: Label
+        :param order: the classification order of the first term
+        :type order: int
+        :param related: related term (if any). Default: ''
+        :type related: str
+        :return: self
+        :rtype: TermList
+        """
+        for w in items:
+            self._classify(w, label, order, related)
+            if order >= 0:
+                order += 1
+
+        return self
+
+    def _classify(self, w, label, order, related):
+        """
+        Sets label, order and related of a Term of self
+
+        :param w: the Term in self to classify
+        :type w: Term
+        :param label: the Label to be assigned to the term
+        :type label: Label
+        :param order: the classification order
+        :type order: int
+        :param related: related term
+        :type related: str
+        """
+        if self._dirty_service is not None:
+            self._dirty_service.add(w.index)
+        if self._dirty_rows is not None and w.label != label:
+            self._dirty_rows.add(w.index)
+        if self._label_count is not None:
+            self._label_count[w.label] -= 1
+            self._label_count[label] += 1
+        if self._unordered is not None:
+            if w.order < 0:
+                self._unordered[w.label].discard(w.index)
+            if order < 0:
+                self._unordered.setdefault(label, set()).add(w.index)
+        w.label = label
+        self._set_order(w, order)
+        w.related = related
+        # move w at the end
+        del self._items[w.index]
+        self._items[w.index] = w
+        self._list = None
+
+    def get_related_items(self, key, label=Label.labels['NONE']):
+        """
+        Gets a new TermList with the items in self related to key
+
+        Only the terms with the specified label and without a classification
+        order are considered. The returned TermList is sorted by index.
+        The cost depends on the number of terms that contain all the tokens
+        of key, not on the length of self. If a containment graph is set and
+        key is one of its terms, the terms containing key are read from the
+        graph.
+        :param key: the substring to find in the terms in self.items
+        :type key: str
+        :param label: label to consider
+        :type label: Label
+        :return: the terms related to key
+        :rtype: TermList
+        """
+        containing = self._graph_related(key)
+        if containing is not None:
+            containing = [w for w in containing
+                          if w.label == label and w.order < 0]
+            containing.sort(key=lambda t: t.index)
+            return TermList(containing)
+
+        candidates = self._candidates(key)
+        if candidates is None:
+            # no token in key: fallback to the full scan
+            candidates = self.items
+
+        candidates = [w for w in candidates
+                      if w.label == label and w.order < 0]
+        matcher = utils.word_matcher(key)
+        found = matcher.search_all([w.string for w in candidates])
+        containing = [candidates[i] for i in found]
+        containing.sort(key=lambda t: t.index)
+        return TermList(containing)
+
     def return_related_items(self, key, label=Label.labels['NONE']):
         """
         Searches related items in self and returns the resulting partition
@@ -586,25 +2348,11 @@ class TermList:
         :return: the partition of the items in self based on key
         :rtype: (TermList, TermList)
         """
-        containing = []
-        not_containing = []
-        t0 = time.time()
-        for w in self.items:
-            if w.label != label or w.order >= 0:
-                continue
-
-            if self.is_related(w.string, key):
-                containing.append(w)
-            else:
-                not_containing.append(w)
-
-        co = TermList(containing)
-        nc = TermList(not_containing)
-        co.sort_by_index()
-        nc.sort_by_index()
-        t1 = time.time()
-        # debug_logger.debug("dur {}".format(t1-t0))
-        return co, nc
+        co = self.get_related_items(key, label=label)
+        related = {w.index for w in co.items}
+        # the unordered Terms are kept in an index: no scan of self.items
+        not_containing = sorted(self._unordered_indexes(label) - related)
+        return co, TermList([self._items[i] for i in not_containing])
 
     def count_classified(self):
         """
@@ -613,25 +2361,30 @@ class TermList:
         :return: the number of classified terms
         :rtype: int
         """
-        return len(self.get_classified())
+        return len(self) - self._labels()[Label.labels['NONE']]
 
     def count_by_label(self, label):
         """
         Counts the terms classified as label
 
         :param label: the label to search
-        :type label: Label
+        :type label: Label or list[Label]
         :return: the number of terms classified as label
         :rtype: int
         """
-        return len(self.get_from_label(label))
+        if isinstance(label, tuple):
+            label = [label]
+        elif not isinstance(label, (list, tuple)):
+            raise TypeError('label has wrong type {}'.format(type(label)))
+
+        count = self._labels()
+        return sum(count[lab] for lab in label)
 
     def count_labels(self):
         """Counts all the labels used for the items."""
         count = {Label.labels[lab][0]: 0 for lab in Label.labels}
-        for item in self.items:
-            lab = item.label[0]
-            count[lab] += 1
+        for lab, n in self._labels().items():
+            count[lab[0]] += n
         # removes the NONE 'empty' label
         count.pop('', None)
         return count
@@ -661,9 +2414,307 @@ class TermList:
         :return: True if string contains substring
         :rtype: bool
         """
-        for _ in utils.substring_index(string, substring):
-            # if here there at least one instance of substring
-            return True
+        return utils.word_matcher(substring).search(string)
+
+
+class TermQueue:
+    """
+    Queue of the terms to be classified
+
+    The queue is made of two parts: the front, that holds the terms explicitly
+    put before all the others (the related terms and the terms restored by an
+    undo), and the rest, that holds all the other terms sorted by index.
+    The rest is kept as a list of sorted buckets of indexes, so the insertion
+    and the removal of a term cost O(log n) plus the size of a bucket, and
+    the first terms can be iterated without touching the others.
+    """
+
+    BUCKET_SIZE = 1000
+
+    def __init__(self, items=None):
+        """
+        Creates a TermQueue
+
+        :param items: the terms to put in the queue. Default: None
+        :type items: list[Term] or None
+        """
+        self._front = collections.deque()
+        self._terms = {}
+        self._buckets = []
+        self._maxes = []
+        if items is None:
+            items = []
+
+        for t in items:
+            self._terms[t.index] = t
+
+        indexes = sorted(self._terms)
+        for i in range(0, len(indexes), self.BUCKET_SIZE):
+            bucket = indexes[i:i + self.BUCKET_SIZE]
+            self._buckets.append(bucket)
+            self._maxes.append(bucket[-1])
+
+    def __len__(self):
+        return len(self._front) + len(self._terms)
+
+    def __iter__(self):
+        yield from self._front
+        for bucket in self._buckets:
+            for idx in bucket:
+                yield self._terms[idx]
+
+    def first(self):
+        """
+        Gives the first term of the queue without removing it
+
+        :return: the first term of the queue or None if the queue is empty
+        :rtype: Term or None
+        """
+        if len(self._front) > 0:
+            return self._front[0]
+
+        if len(self._buckets) > 0:
+            return self._terms[self._buckets[0][0]]
+
+        return None
+
+    def pop(self):
+        """
+        Removes and returns the first term of the queue
+
+        :return: the first term of the queue
+        :rtype: Term
+        :raise IndexError: if the queue is empty
+        """
+        if len(self._front) > 0:
+            return self._front.popleft()
+
+        if len(self._buckets) == 0:
+            raise IndexError('pop from an empty TermQueue')
+
+        return self._remove(self._buckets[0][0])
+
+    def push_front(self, term):
+        """
+        Puts term before all the other terms of the queue
+
+        :param term: the term to put in the queue
+        :type term: Term
+        """
+        self._front.appendleft(term)
+
+    def insert(self, term):
+        """
+        Puts term in the queue in the position given by its index
+
+        If the rest of the queue already holds a term with the same index, it
+        is replaced by term.
+
+        :param term: the term to put in the queue
+        :type term: Term
+        """
+        idx = term.index
+        replaced = idx in self._terms
+        self._terms[idx] = term
+        if replaced:
+            return
+
+        if len(self._buckets) == 0:
+            self._buckets.append([idx])
+            self._maxes.append(idx)
+            return
+
+        b = bisect.bisect_left(self._maxes, idx)
+        if b == len(self._buckets):
+            b -= 1
+
+        bucket = self._buckets[b]
+        bisect.insort(bucket, idx)
+        self._maxes[b] = bucket[-1]
+        if len(bucket) > 2 * self.BUCKET_SIZE:
+            half = len(bucket) // 2
+            self._buckets[b:b + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[b:b + 1] = [bucket[half - 1], bucket[-1]]
+
+    def _remove(self, idx):
+        """
+        Removes the term with index idx from the rest of the queue
+
+        :param idx: index of the term to remove
+        :type idx: int
+        :return: the removed term
+        :rtype: Term
+        :raise KeyError: if no term with index idx is in the rest of the queue
+        """
+        if idx not in self._terms:
+            raise KeyError(idx)
+
+        b = bisect.bisect_left(self._maxes, idx)
+        bucket = self._buckets[b]
+        del bucket[bisect.bisect_left(bucket, idx)]
+        if len(bucket) == 0:
+            del self._buckets[b]
+            del self._maxes[b]
         else:
-            # if here the generator is empty
-            return False
+            self._maxes[b] = bucket[-1]
+
+        return self._terms.pop(idx)
+
+    def front_size(self):
+        """
+        Gives the number of terms in the front of the queue
+
+        :return: the number of terms in the front
+        :rtype: int
+        """
+        return len(self._front)
+
+    def get_front(self):
+        """
+        Gives the terms in the front of the queue
+
+        :return: a copy of the front of the queue
+        :rtype: list[Term]
+        """
+        return list(self._front)
+
+    def sort_front(self):
+        """
+        Sorts the terms in the front of the queue by index
+        """
+        self._front = collections.deque(sorted(self._front,
+                                               key=lambda t: t.index))
+
+    def reset(self):
+        """
+        Puts back all the terms in the front in their position by index
+        """
+        while len(self._front) > 0:
+            self.insert(self._front.popleft())
+
+    def promote(self, terms):
+        """
+        Moves terms in front of the queue
+
+        The terms previously in the front are put back in their position by
+        index. terms must be already in the queue: they are put in the front
+        in the order of the list.
+        :param terms: the terms to move
+        :type terms: list[Term]
+        """
+        self.reset()
+        for t in terms:
+            self._remove(t.index)
+            self._front.append(t)
+
+
+class SaveWorker:
+    """
+    Thread that writes SaveJob in background
+
+    The jobs are written in the order they are submitted. A job that rewrites
+    all the data of a file replaces the pending jobs on the same file, and the
+    pending jobs that append to the same file are merged, so overlapping save
+    requests do not pile up.
+    The thread is started with the first job. An error raised by a job is
+    logged and raised again by flush and close.
+    """
+
+    def __init__(self, logger=None):
+        """
+        Creates a SaveWorker
+
+        :param logger: logger for the errors of the jobs. Default: None
+        :type logger: logging.Logger or None
+        """
+        self._cond = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._busy = False
+        self._closed = False
+        self._error = None
+        self._logger = logger
+
+    def submit(self, job):
+        """
+        Queues job to be written in background
+
+        :param job: the job to write
+        :type job: SaveJob
+        :raise RuntimeError: if the worker has been closed
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('the SaveWorker is closed')
+
+            if job.full:
+                self._pending = [j for j in self._pending
+                                 if j.target != job.target]
+                self._pending.append(job)
+            elif len(self._pending) == 0 or not self._pending[-1].merge(job):
+                self._pending.append(job)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='fawoc-save')
+                self._thread.start()
+
+            self._cond.notify_all()
+
+    def _run(self):
+        """
+        Main loop of the thread
+        """
+        while True:
+            with self._cond:
+                while len(self._pending) == 0 and not self._closed:
+                    self._cond.wait()
+
+                if len(self._pending) == 0:
+                    return
+
+                job = self._pending.pop(0)
+                self._busy = True
+
+            try:
+                job.write()
+            except Exception as err:
+                if self._logger is not None:
+                    self._logger.exception(f'Error saving {job.target}')
+                self._error = err
+
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def _raise_error(self):
+        """
+        Raises the last error of the jobs, if any
+        """
+        if self._error is not None:
+            err = self._error
+            self._error = None
+            raise err
+
+    def flush(self):
+        """
+        Waits until all the submitted jobs are written
+        """
+        with self._cond:
+            while len(self._pending) > 0 or self._busy:
+                self._cond.wait()
+
+        self._raise_error()
+
+    def close(self):
+        """
+        Writes all the submitted jobs and stops the thread
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self._raise_error()
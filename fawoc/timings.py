@@ -0,0 +1,160 @@
+import collections
+import json
+import time
+
+# number of samples of each phase used to compute the percentiles
+WINDOW = 1000
+PERCENTILES = (50, 95, 99)
+
+
+class ActionTimer:
+    """
+    Times the phases of a single action
+
+    Each call to lap ends a phase, that starts at the end of the previous one
+    (or when the timer is created). done ends the action and records its
+    phases and its total time in the Timings.
+    """
+    __slots__ = ('_timings', '_action', '_start', '_last', '_laps')
+
+    def __init__(self, timings, action):
+        """
+        Starts the timer
+
+        :param timings: the timings that records the action
+        :type timings: Timings
+        :param action: name of the action
+        :type action: str
+        """
+        self._timings = timings
+        self._action = action
+        self._start = time.perf_counter_ns()
+        self._last = self._start
+        self._laps = []
+
+    def lap(self, phase):
+        """
+        Ends a phase of the action
+
+        :param phase: name of the phase
+        :type phase: str
+        """
+        now = time.perf_counter_ns()
+        self._laps.append((phase, now - self._last))
+        self._last = now
+
+    def done(self):
+        """
+        Ends the action and records its timings
+        """
+        for phase, elapsed in self._laps:
+            self._timings.record(self._action, phase, elapsed)
+
+        self._timings.record(self._action, 'total', self._last - self._start)
+
+
+class Timings:
+    """
+    Rolling timings of the phases of the actions
+
+    For each action and phase, the last WINDOW samples are kept, to compute
+    the percentiles. The times are measured with a monotonic clock, in ns.
+    """
+
+    def __init__(self, window=WINDOW):
+        """
+        :param window: number of samples kept for each phase
+        :type window: int
+        """
+        self._window = window
+        # (action, phase) -> last samples, in insertion order
+        self._samples = {}
+        self._counts = collections.Counter()
+
+    def start(self, action):
+        """
+        Starts the timing of an action
+
+        :param action: name of the action
+        :type action: str
+        :return: the timer of the action
+        :rtype: ActionTimer
+        """
+        return ActionTimer(self, action)
+
+    def record(self, action, phase, elapsed):
+        """
+        Records a sample
+
+        :param action: name of the action
+        :type action: str
+        :param phase: name of the phase
+        :type phase: str
+        :param elapsed: time elapsed in ns
+        :type elapsed: int
+        """
+        key = (action, phase)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = collections.deque(maxlen=self._window)
+            self._samples[key] = samples
+
+        samples.append(elapsed)
+        self._counts[key] += 1
+
+    def stats(self):
+        """
+        Computes the statistics of each phase of each action
+
+        The percentiles and the max are computed on the last samples and are
+        in ms. count is the number of all the samples recorded.
+
+        :return: the statistics, by action and phase
+        :rtype: dict[str, dict[str, dict[str, float]]]
+        """
+        stats = {}
+        for (action, phase), samples in self._samples.items():
+            ordered = sorted(samples)
+            phase_stats = {'count': self._counts[(action, phase)]}
+            for p in PERCENTILES:
+                # nearest-rank percentile
+                rank = max(0, -(-p * len(ordered) // 100) - 1)
+                phase_stats[f'p{p}'] = ordered[rank] / 1e6
+
+            phase_stats['max'] = ordered[-1] / 1e6
+            stats.setdefault(action, {})[phase] = phase_stats
+
+        return stats
+
+    def format(self):
+        """
+        Formats the statistics as a table
+
+        :return: the lines of the table
+        :rtype: list[str]
+        """
+        heads = ''.join(f'{"p" + str(p):>8}' for p in PERCENTILES)
+        lines = [f'{"action":10}{"phase":8}{"count":>7}{heads}{"max":>8}']
+        for action, phases in self.stats().items():
+            for phase, s in phases.items():
+                values = ''.join(f'{s["p" + str(p)]:8.2f}'
+                                 for p in PERCENTILES)
+                lines.append(f'{action:10}{phase:8}{s["count"]:7}{values}'
+                             f'{s["max"]:8.2f}')
+
+        return lines
+
+    def dump(self, path):
+        """
+        Writes the statistics to a json file
+
+        :param path: path of the json file
+        :type path: str or pathlib.Path
+        """
+        data = {
+            'unit': 'ms',
+            'window': self._window,
+            'actions': self.stats(),
+        }
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=2)
@@ -1,8 +1,24 @@
+import atexit
+import bisect
+import csv
+import functools
+import itertools
 import logging
+import logging.handlers
+import mmap
+import operator
+import os
+import queue
 import string
 import json
+import re
 import sys
 
+# maximum number of log records waiting to be written by a queued logger
+LOG_QUEUE_SIZE = 10000
+# number of compiled matchers kept by word_matcher
+MATCHER_CACHE_SIZE = 1024
+
 
 def load_dtj(infile):
     """
@@ -43,12 +59,59 @@ def assert_column(infile, dataframe, column_name):
         sys.exit(1)
 
 
+class _BatchFileHandler(logging.FileHandler):
+    """
+    FileHandler that does not flush the file after each record
+
+    The file is flushed by flush_batch.
+    """
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class _BlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that waits for a free slot if the queue is full
+    """
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+class _BatchQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that flushes its handlers only when the queue is empty
+
+    In this way, the records queued together are written with a single flush.
+    """
+
+    def enqueue_sentinel(self):
+        # the queue is bounded: wait for a free slot
+        self.queue.put(self._sentinel)
+
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush_batch()
+
+
 def setup_logger(name, log_file,
                  formatter=logging.Formatter('%(asctime)s %(levelname)s %(message)s'),
-                 level=logging.INFO):
+                 level=logging.INFO, queued=False,
+                 queue_size=LOG_QUEUE_SIZE):
     """
     Function to setup a generic loggers.
 
+    If queued is True, the records are put in a queue and written to the file
+    by a background thread, in batches, so the caller never waits for the
+    disk. If the queue is full, the caller waits for a free slot. The records
+    in the queue are written at the exit of the program.
+
     :param name: name of the logger
     :type name: str
     :param log_file: file of the log
@@ -57,17 +120,161 @@ def setup_logger(name, log_file,
     :type formatter: logging.Formatter
     :param level: level to display
     :type level: int
+    :param queued: if True, the file is written by a background thread.
+        Default: False
+    :type queued: bool
+    :param queue_size: maximum number of records in the queue
+    :type queue_size: int
     :return: the logger
     :rtype: logging.Logger
     """
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
     logger = logging.getLogger(name)
     logger.setLevel(level)
+    if queued:
+        file_handler = _BatchFileHandler(log_file)
+        file_handler.setFormatter(formatter)
+        log_queue = queue.Queue(maxsize=queue_size)
+        listener = _BatchQueueListener(log_queue, file_handler)
+        listener.start()
+        # the queue is emptied before the handlers are closed by logging
+        atexit.register(listener.stop)
+        handler = _BlockingQueueHandler(log_queue)
+    else:
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(formatter)
+
     logger.addHandler(handler)
     return logger
 
 
+class WordMatcher:
+    """
+    Finds one or more needles between word boundaries
+
+    The needles are compiled once in a regular expression, where each needle
+    is found only if it is preceded and followed by a delimiter, or by the
+    begin or the end of the string. The matches are the ones of
+    substring_index: they do not overlap, and at the same position the longest
+    needle wins.
+    The empty needles are ignored, so a matcher without needles never matches.
+    """
+
+    def __init__(self, needles, delim=string.whitespace):
+        """
+        Compiles the needles
+
+        :param needles: the string or the strings to search
+        :type needles: str or Iterable[str]
+        :param delim: character used as word boundaries
+        :type delim: str or list[str]
+        """
+        if isinstance(needles, str):
+            needles = [needles]
+        if isinstance(delim, list):
+            delim = ''.join(delim)
+
+        self._needles = sorted({n for n in needles if n != ''}, key=len,
+                               reverse=True)
+        self._delim = delim
+        if len(self._needles) == 0:
+            self._regex = None
+            return
+
+        if delim == '':
+            # no boundary: only the whole string matches
+            before, after = r'\A', r'\Z'
+        else:
+            cls = re.escape(delim)
+            before, after = f'(?<![^{cls}])', f'(?![^{cls}])'
+
+        alt = '|'.join(re.escape(n) for n in self._needles)
+        self._regex = re.compile(f'{before}(?:{alt}){after}')
+
+    def finditer(self, haystack):
+        """
+        Generator function that gives the slices of haystack with a needle
+
+        :param haystack: the string to examine
+        :type haystack: str
+        :return: a generator that yields the slice indexes (begin, end) where
+            a needle is found
+        """
+        if self._regex is None:
+            return
+
+        for m in self._regex.finditer(haystack):
+            yield m.span()
+
+    def search(self, haystack):
+        """
+        Tells if haystack contains at least one needle
+
+        :param haystack: the string to examine
+        :type haystack: str
+        :return: True if a needle is found
+        :rtype: bool
+        """
+        return self._regex is not None and \
+            self._regex.search(haystack) is not None
+
+    def search_all(self, haystacks):
+        """
+        Tells which strings contain at least one needle
+
+        The strings are joined with a delimiter that is not in any needle, and
+        searched in a single pass of the regular expression, so the cost of
+        the search is paid once and not for each string. If all the
+        delimiters are in the needles, the strings are searched one at a time.
+
+        :param haystacks: the strings to examine
+        :type haystacks: list[str]
+        :return: the indexes of the strings that contain a needle, in order
+        :rtype: list[int]
+        """
+        if self._regex is None or len(haystacks) == 0:
+            return []
+
+        sep = next((d for d in self._delim
+                    if not any(d in n for n in self._needles)), None)
+        if sep is None:
+            return [i for i, h in enumerate(haystacks) if self.search(h)]
+
+        text = sep.join(haystacks)
+        # begin of each string in text
+        starts = [0]
+        for h in haystacks:
+            starts.append(starts[-1] + len(h) + 1)
+        found = []
+        pos = 0
+        m = self._regex.search(text, pos)
+        while m is not None:
+            i = bisect.bisect_right(starts, m.start()) - 1
+            found.append(i)
+            # skip to the next string
+            pos = starts[i + 1]
+            m = self._regex.search(text, pos)
+
+        return found
+
+
+@functools.lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def word_matcher(needle, delim=string.whitespace):
+    """
+    Gives the compiled WordMatcher of a needle
+
+    The last MATCHER_CACHE_SIZE matchers are cached, so the needle is compiled
+    only the first time it is searched.
+
+    :param needle: the string to search
+    :type needle: str
+    :param delim: character used as word boundaries
+    :type delim: str
+    :return: the matcher of needle
+    :rtype: WordMatcher
+    """
+    return WordMatcher(needle, delim)
+
+
 def substring_index(haystack, needle, delim=string.whitespace):
     """
     Generator function that give the slices of haystack where needle is found
@@ -91,31 +298,10 @@ def substring_index(haystack, needle, delim=string.whitespace):
     :type delim: str or list[str]
     :return: a generator that yields the slice indexes where needle is found
     """
-    if needle == '':
-        return
-
-    if haystack == needle:
-        yield (0, len(haystack))
-        return
-
     if isinstance(delim, list):
         delim = ''.join(delim)
 
-    start = 0
-    idx = haystack.find(needle, start)
-    while idx >= 0:
-        start = idx + len(needle)
-        if idx == 0:
-            if haystack[len(needle)] in delim:
-                yield (0, len(needle))
-        elif haystack[idx - 1] in delim:
-            if idx + len(needle) == len(haystack):
-                yield (idx, len(haystack))
-                return
-            elif haystack[idx + len(needle)] in delim:
-                yield (idx, idx + len(needle))
-
-        idx = haystack.find(needle, start)
+    yield from word_matcher(needle, delim).finditer(haystack)
 
 
 def substring_check(haystack, needle, delim=string.whitespace):
@@ -137,3 +323,143 @@ def substring_check(haystack, needle, delim=string.whitespace):
         return True
     else:
         return False
+
+
+# splits a line after each '\r' not followed by '\n'
+_LONE_CR = re.compile(b'\r(?!\n)')
+
+
+class TsvColumnReader:
+    """
+    Reader of some columns of a tab separated file
+
+    It reads the file like a csv.DictReader with the tab as delimiter, but
+    each row is a tuple with only the values of the requested columns, in the
+    requested order. The columns missing from the header and the fields
+    missing from a short row are None.
+    The file is memory-mapped, and only the fields up to the last requested
+    column are split. The lines without quote characters are split directly;
+    the others are parsed by the csv module, so the quoting semantics (quoted
+    delimiters, doubled quotes and quoted line breaks) is the same of
+    csv.DictReader. As with csv.DictReader, empty lines are skipped and, if a
+    column name is repeated, the last column wins.
+    The reader must be closed, or used as a context manager.
+
+    :type fieldnames: list[str] or None
+    """
+
+    def __init__(self, infile, columns, encoding='utf-8'):
+        """
+        Opens a tab separated file and reads its header
+
+        :param infile: path to the file
+        :type infile: str or Path
+        :param columns: names of the columns to read
+        :type columns: list[str]
+        :param encoding: encoding of the file. Default: 'utf-8'
+        :type encoding: str
+        """
+        self._encoding = encoding
+        self._file = open(infile, 'rb')
+        self._mmap = None
+        self.fieldnames = None
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._lines = iter(())
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            self._lines = self._split_lines()
+            self.fieldnames = self._next_record()
+
+        positions = {}
+        for i, name in enumerate(self.fieldnames or []):
+            positions[name] = i
+
+        self._positions = [positions.get(c) for c in columns]
+        self._last = max((p for p in self._positions if p is not None),
+                         default=-1)
+        # the missing columns take the None appended to the fields
+        getter = operator.itemgetter(*[-1 if p is None else p
+                                       for p in self._positions])
+        if len(columns) == 1:
+            self._getter = lambda fields: (getter(fields), )
+        else:
+            self._getter = getter
+
+    def _split_lines(self):
+        """
+        Generator function that gives the lines of the file
+
+        The lines are split as in a file opened with newline='', so also a
+        lone carriage return ends a line.
+
+        :return: a generator that yields the lines with their line ending
+        """
+        for line in iter(self._mmap.readline, b''):
+            if b'\r' in line and _LONE_CR.search(line):
+                start = 0
+                for m in _LONE_CR.finditer(line):
+                    yield line[start:m.end()]
+                    start = m.end()
+
+                if start < len(line):
+                    yield line[start:]
+            else:
+                yield line
+
+    def _next_record(self, first=None):
+        """
+        Reads the next record with the csv module
+
+        :param first: the first line of the record, already read
+        :type first: bytes or None
+        :return: all the fields of the record or None at the end of the file
+        :rtype: list[str] or None
+        """
+        lines = self._lines
+        if first is not None:
+            lines = itertools.chain([first], lines)
+
+        enc = self._encoding
+        text = (line.decode(enc) for line in lines)
+        return next(csv.reader(text, delimiter='\t'), None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Closes the file
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+        self._file.close()
+
+    def __iter__(self):
+        enc = self._encoding
+        last = self._last
+        getter = self._getter
+        for raw in self._lines:
+            line = raw.rstrip(b'\r\n')
+            if b'"' in line:
+                # quoted fields: parse them with the csv module
+                fields = self._next_record(first=raw)
+                if len(fields) == 0:
+                    continue
+            elif len(line) > 0:
+                fields = line.decode(enc).split('\t', last + 1)
+            else:
+                continue
+
+            if len(fields) > last:
+                fields.append(None)
+                yield getter(fields)
+            else:
+                # short row
+                yield tuple(None if p is None or p >= len(fields) else fields[p]
+                            for p in self._positions)